@@ -14,7 +14,8 @@
     See readme for caveats.
 
     Whisper was trained on and uses 30 second windows of audio, so chunks shorter than 30 seconds are inefficiently processed.
-    Developed a "limiter" method that identifies when the number of desired processes will cause the fragment length to go below 30 seconds.
+    The audio is cut into units that are whole multiples of 30 seconds, several for each process, and each process
+    takes the next unit when it is free, so one slow unit does not hold up the others (see chooseUnitSeconds).
 """
 
 
@@ -29,25 +30,37 @@ ffmpeg_path = "/usr/local/bin/" # use the path to your ffmpeg executable
 os.environ["PATH"] += os.pathsep + ffmpeg_path
 
 from   pydub import AudioSegment
-from   pydub.utils import make_chunks
 from   timeit import default_timer as timer
-from   multiprocessing import Process, Queue, set_start_method, Manager
+from   multiprocessing import shared_memory, resource_tracker
+from   collections import namedtuple, deque
 from   pathlib import Path
-from   whisper.utils import write_srt
-import whisper
-import multiprocessing, time
-import ffmpeg, json, subprocess
+import numpy
+import multiprocessing, multiprocessing.connection, time, queue, signal, atexit, weakref, traceback
+import ffmpeg, json, subprocess, sys, argparse, hashlib
+import csv, wave, resource, platform, tempfile
+import threading, contextlib, http.server, mmap, gc
 
 
 """
     When launching the parallel processes from another process, you must fork
     or there will be a runtime error because of a looping back to the ___MAIN___ file.
     ENABLE MULITPLE PARALLEL PROCESSES WHILE ALSO RESOLVING THE RUNTIME ERROR
-     
-    set_start_method('fork') # MUST HAVE WHEN CALLING FROM PYTHONKIT
+
+    The workers and their pipes come from a fork context (MUST HAVE WHEN CALLING FROM PYTHONKIT),
+    so importing this module no longer changes the start method of the process that imports it.
+
+    Importing is cheap: whisper and torch are imported, and models are loaded, on first use (see getWhisperModel).
 """
 
-set_start_method('fork') # MUST HAVE WHEN CALLING FROM PYTHONKIT
+gForkContext       = multiprocessing.get_context("fork")
+
+gWhisperModels     = {}     # model name -> loaded model, loaded on first use and inherited by forked workers
+gSharedWeights     = {}     # model name -> shared memory region holding its weights (see shareModelWeights)
+gWhisperModel      = None   # the model used by this process (inherited by forked workers)
+gWhisperModelName  = None   # name of the model held in gWhisperModel
+gTranscribeOptions = {"fp16": False} # prevent complaint with fp16=False on CPU (also part of the cache key)
+gCacheUnitSeconds  = 60     # unit size when a TranscriptCache is used, so the chunks (and their keys) do not depend on the process count
+gLivePools         = weakref.WeakSet() # every started worker pool, so we can shut them down on exit
 
 
 #   ___ UTILITY AND TESTING METHODS ___
@@ -140,7 +153,7 @@ def downloadModels():
     # These model will be downloaded if you dont have them
     models = ["tiny.en","base.en","small.en","medium.en"]
     for modelName in models:
-        _ = whisper.load_model(modelName)
+        _ = getWhisperModel(modelName)
         
 
 def makeStaticVideo(audioInput, imageInput, outputFile):
@@ -167,11 +180,22 @@ def makeStaticVideo(audioInput, imageInput, outputFile):
 
 #   ___ SUPPORTING METHODS ___
 
-def writeTestfile(filePath, output_dir, usingSegments, chunkSeconds):
+def writeTestfile(filePath, output_dir, usingSegments, chunkSeconds, chunkOffsets=None, metrics=None):
+    metrics           = metrics or RunMetrics()
     audio_basename    = Path(filePath).stem
-    transciptSegments = repairTranscriptSegments(usingSegments,chunkSeconds)
+    with metrics.span("repair", segments=len(usingSegments)):
+        transciptSegments = repairTranscriptSegments(usingSegments,chunkSeconds,chunkOffsets)
+    with metrics.span("write", file=audio_basename):
+        writeTranscriptFiles(output_dir, audio_basename, transciptSegments)
+
+
+def writeTranscriptFiles(output_dir, audio_basename, transciptSegments):
+    columns = segmentColumns([transciptSegments]) # already on the timeline, numbered from 1 in the SRT
     with open(Path(output_dir) / (audio_basename + ".srt"), "w", encoding="utf-8") as outFile:
-        write_srt(transciptSegments, outFile)
+        outFile.write(columnsToSrt(columns))
+        outFile.close()
+    with open(Path(output_dir) / (audio_basename + ".vtt"), "w", encoding="utf-8") as outFile:
+        outFile.write(columnsToVtt(columns))
         outFile.close()
     with open(Path(output_dir) / (audio_basename + ".json"), "w", encoding="utf-8") as outFile:
         json.dump(transciptSegments, outFile)
@@ -182,17 +206,205 @@ def writeTestfile(filePath, output_dir, usingSegments, chunkSeconds):
         outFile.close()
 
 
-def writeTextFile(filePath, output_dir, text):
-    audio_basename = Path(filePath).stem  # save JSON using the same base name
-    with open(Path(output_dir) / (audio_basename + "_.txt"), "w", encoding="utf-8") as outFile:
-        print(text, file=outFile, flush=True)
+class TranscriptWriter:
+    """
+        Write the SRT, VTT, JSONL and TXT of one input while it is being transcribed,
+        so captioning or indexing can start after the first chunk instead of
+        after the slowest one.
+
+        Chunks complete in any order.  add() holds each chunk until every chunk
+        before it has been added, then repairs its timeline (offset by the
+        chunk's start, clamped to its length, ids continued from the previous
+        chunk, see repairColumns) and appends it to the files.  Each chunk is flushed whole, so
+        the files are valid, if partial, at any time.  close() writes the
+        complete JSON, as writeTranscriptFiles does, once every chunk is written.
+
+        "chunkOffsets" is the (start, end) in seconds of each chunk in the input,
+        or give each chunk's offset to add() when the chunks are not known in
+        advance (a stream).  With "windowOffsets" (overlapped chunks) the overlaps
+        are merged as the chunks are written (see mergeOverlappedChunk).
+    """
+
+    def __init__(self, output_dir, audio_basename, chunkOffsets=None, windowOffsets=None, metrics=None):
+        self.basePath      = Path(output_dir) / audio_basename
+        self.chunkOffsets  = dict(enumerate(chunkOffsets or []))
+        self.windowOffsets = windowOffsets
+        self.metrics       = metrics or RunMetrics()
+        self.pending       = {}   # chunk index -> (text, segments) of chunks that completed early
+        self.nextIndex     = 0    # the next chunk to be written
+        self.previousEnd   = None # carried from chunk to chunk by the overlap merge
+        self.text          = ""
+        self.segments      = []   # repaired, in timeline order
+        self.opened        = timer()
+        self.firstCaption  = None # seconds from opening to the first segment written
+        self.srtFile       = open(str(self.basePath) + ".srt", "w", encoding="utf-8")
+        self.vttFile       = open(str(self.basePath) + ".vtt", "w", encoding="utf-8")
+        self.jsonlFile     = open(str(self.basePath) + ".jsonl", "w", encoding="utf-8")
+        self.txtFile       = open(str(self.basePath) + ".txt", "w", encoding="utf-8")
+        self.vttFile.write(columnsToVtt(segmentColumns([])))
+
+    def add(self, index, text, segments, chunkOffset=None):
+        if (chunkOffset is not None):
+            self.chunkOffsets[index] = chunkOffset
+        self.pending[index] = (text, segments)
+        while (self.nextIndex in self.pending):
+            self.writeChunk(self.nextIndex, *self.pending.pop(self.nextIndex))
+            self.nextIndex += 1
+
+    def writeChunk(self, index, text, segments):
+        if (self.windowOffsets is not None):
+            with self.metrics.span("merge", chunk=index):
+                segments, self.previousEnd = mergeOverlappedChunk(index, segments, self.windowOffsets, self.chunkOffsets, self.previousEnd)
+                text = "".join(segment["text"] for segment in segments)
+        with self.metrics.span("repair", chunk=index, segments=len(segments)):
+            columns  = mergeChunkSegments([segments], [self.chunkOffsets[index]], firstId=len(self.segments))
+            repaired = columnsToJson(columns)
+            for segment in repaired:
+                if segment.get("words"): # the times of the words are relative to the chunk too
+                    segment["words"] = [dict(word, start=word["start"] + self.chunkOffsets[index][0], end=word["end"] + self.chunkOffsets[index][0])
+                                        for word in segment["words"]]
+        with self.metrics.span("write", chunk=index, segments=len(repaired)):
+            self.srtFile.write(columnsToSrt(columns))
+            self.vttFile.write(columnsToVtt(columns, header=False))
+            for segment in repaired:
+                print(json.dumps(segment), file=self.jsonlFile)
+                print(segment['text'].strip(), file=self.txtFile, end=" ")
+            for outFile in (self.srtFile, self.vttFile, self.jsonlFile, self.txtFile):
+                outFile.flush()
+        self.text += text
+        self.segments.extend(repaired)
+        if (self.firstCaption is None and repaired):
+            self.firstCaption = (timer() - self.opened)
+            self.metrics.emit({"event": "firstCaption", "file": self.basePath.name, "seconds": round(self.firstCaption, 6)})
+
+    def complete(self):
+        # True when every chunk has been written
+        return (not self.pending and self.nextIndex == len(self.chunkOffsets))
+
+    def close(self):
+        if self.srtFile.closed:
+            return
+        for outFile in (self.srtFile, self.vttFile, self.jsonlFile, self.txtFile):
+            outFile.close()
+        if self.complete():
+            with open(str(self.basePath) + ".json", "w", encoding="utf-8") as outFile:
+                json.dump(self.segments, outFile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#    ____ COLUMNAR TIMELINE ___
+
+"""
+    The segments of a run as columns: NumPy arrays of start, end, id and chunk
+    index, with the segment dicts themselves (text, tokens, ...) by reference.
+    The timeline is repaired and the SRT, VTT and JSON are made from the
+    arrays in one pass, so 100k+ segments take milliseconds.
+"""
+SegmentColumns = namedtuple("SegmentColumns", ["start", "end", "id", "chunk", "segments"])
+
+
+def segmentColumns(chunkSegments):
+    """
+        The segments of each chunk (one list per chunk, in order, empty when the
+        chunk had no speech) as SegmentColumns, still relative to each chunk.
+        The chunk of each segment comes from the length of each list, not from
+        its id, so an empty chunk cannot shift the chunks after it.
+    """
+    counts   = numpy.fromiter((len(segments) for segments in chunkSegments), numpy.int64, count=len(chunkSegments))
+    segments = [segment for chunk in chunkSegments for segment in chunk]
+    start    = numpy.fromiter((segment["start"] for segment in segments), numpy.float64, count=len(segments))
+    end      = numpy.fromiter((segment["end"] for segment in segments), numpy.float64, count=len(segments))
+    return SegmentColumns(start, end, numpy.arange(len(segments)), numpy.repeat(numpy.arange(len(counts)), counts), segments)
+
+
+def repairColumns(columns, chunkOffsets, firstId=0):
+    """
+        Place each segment on the input's timeline: clamped to its own chunk's
+        length (a segment cannot end beyond the audio it was transcribed from),
+        offset by its chunk's start, and numbered from firstId.  "chunkOffsets"
+        is the (start, end) in seconds of every chunk, so a short last chunk or
+        chunks of different lengths (split on silence) are placed exactly.
+    """
+    offsets     = numpy.asarray(chunkOffsets, dtype=numpy.float64).reshape(-1, 2)
+    chunkStart  = offsets[columns.chunk, 0]
+    chunkLength = (offsets[:, 1] - offsets[:, 0])[columns.chunk]
+    end         = chunkStart + numpy.clip(columns.end, 0.0, chunkLength)
+    start       = numpy.minimum(chunkStart + numpy.clip(columns.start, 0.0, chunkLength), end)
+    return columns._replace(start=start, end=end, id=numpy.arange(firstId, firstId + len(start)))
+
+
+def mergeChunkSegments(chunkSegments, chunkOffsets, firstId=0):
+    # The segments of each chunk, repaired onto one timeline, as SegmentColumns
+    return repairColumns(segmentColumns(chunkSegments), chunkOffsets, firstId)
+
+
+def columnTimestamps(seconds, separator):
+    # HH:MM:SS,mmm (SRT) or HH:MM:SS.mmm (VTT) of each time in the array, built as ASCII without a loop over the times
+    millis = numpy.rint(numpy.maximum(seconds, 0.0) * 1000).astype(numpy.int64)
+    hours  = (millis // 3600000)
+    if (len(millis) and hours.max() > 99):
+        return ["%02d:%02d:%02d%s%03d" %(milli // 3600000, (milli // 60000) % 60, (milli // 1000) % 60, separator, milli % 1000) for milli in millis.tolist()]
+    minutes, secs, millisecs = (millis // 60000) % 60, (millis // 1000) % 60, (millis % 1000)
+    columns = [hours // 10, hours % 10, None, minutes // 10, minutes % 10, None, secs // 10, secs % 10, None,
+               millisecs // 100, (millisecs // 10) % 10, millisecs % 10]
+    chars   = numpy.empty((len(millis), 12), dtype=numpy.uint8)
+    for position, column in enumerate(columns):
+        chars[:, position] = (ord(separator) if (position == 8) else ord(":")) if (column is None) else (column + ord("0"))
+    return chars.view("S12").ravel().astype(str).tolist()
+
+
+def cueText(segment):
+    return segment["text"].strip().replace("-->", "->")
+
+
+def columnsToSrt(columns):
+    # SRT entries, numbered from id + 1
+    return "".join("%s\n%s --> %s\n%s\n\n" %(number, start, end, cueText(segment)) for number, start, end, segment in
+                   zip((columns.id + 1).tolist(), columnTimestamps(columns.start, ","), columnTimestamps(columns.end, ","), columns.segments))
+
+
+def columnsToVtt(columns, header=True):
+    # WebVTT cues, after the WEBVTT header unless they are appended to a file that has it
+    return ("WEBVTT\n\n" if header else "") + "".join("%s --> %s\n%s\n\n" %(start, end, cueText(segment)) for start, end, segment in
+                   zip(columnTimestamps(columns.start, "."), columnTimestamps(columns.end, "."), columns.segments))
+
+
+def columnsToJson(columns):
+    # The segment dicts with their repaired id, start and end (new dicts, the segments are not changed)
+    return [dict(segment, id=segID, start=start, end=end) for segment, segID, start, end in
+            zip(columns.segments, columns.id.tolist(), columns.start.tolist(), columns.end.tolist())]
 
 
 #    ____ MAIN METHODS  ___
 
+def getWhisperModel(modelName):
+    # The model for modelName, loaded on first use and then kept, one per model name
+    model = gWhisperModels.get(modelName)
+    if (model is None):
+        import whisper
+        model = gWhisperModels[modelName] = whisper.load_model(modelName)
+    return model
+
+
+def preloadModels(*modelNames):
+    """
+        Load the models in this process before any pool is started, so every
+        forked worker inherits them instead of loading its own copy.
+    """
+    for modelName in modelNames:
+        getWhisperModel(modelName)
+
+
 def loadWhisperModel(modelName):
-    global gWhisperModel    # This global is important
-    gWhisperModel = whisper.load_model(modelName)
+    # Make modelName the model used by this process (and by workers forked from it)
+    global gWhisperModel, gWhisperModelName    # This global is important
+    gWhisperModel     = getWhisperModel(modelName)
+    gWhisperModelName = modelName
     
     
 def loadDefaultWhisperModel():
@@ -201,7 +413,7 @@ def loadDefaultWhisperModel():
     print("Initializing... loading model \"%s\"" % (modelName))
 
 
-def repairTranscriptSegments(transcript, chunkSeconds):
+def repairTranscriptSegments(transcript, chunkSeconds, chunkOffsets=None):
     """
         We are repairing the timeline here.
 
@@ -210,36 +422,28 @@ def repairTranscriptSegments(transcript, chunkSeconds):
         an SRT, VTT or some other tool that makes use of timing, this is required.
 
         We expect that for every new audio chunk, the segment information will be
-        re-initialized.  We concatenated each chunk's segments and determining an
-        offset amount for each chunk, then adjust the "start" and "end" segments,
-        so the timestamps are contiguous.
+        re-initialized (the id starts again at 0), so the concatenated segments
+        are split back into their chunks there, and each chunk is offset and
+        clamped by mergeChunkSegments.  The segments are updated in place, so
+        the timestamps are contiguous and the IDs are in sequence.
 
         "chunkSeconds" is the length of each chunk, so we know that the segment["end"]
-        cant be beyond this. After repairing the timeline, from the concatenated chunks
-        we can use the built-in functions to write TEXT, SRT and VTT files.
+        cant be beyond this.  "chunkOffsets", when the chunks are not of equal
+        length (e.g. split on silence), is the (start, end) in seconds of each chunk.
+        A chunk with no segments cannot be seen in the concatenated list, so when
+        a chunk may be empty, keep the segments of each chunk apart and use
+        mergeChunkSegments, as TranscriptWriter does.
     """
-    
-    chunkCount = 0
-    for segIndex, segment in enumerate(transcript):
-        if (segment["id"] == 0):
-            chunkCount += 1
-            if (chunkCount > 1):
-                prevSegment = transcript[segIndex-1] # look back to previous segment
-                if (prevSegment["end"] > chunkSeconds): # impossible to be greater than chunk length
-                    transcript[segIndex-1]["end"] = chunkSeconds
-
-    chunkCount = 0 # re-initialize
-    adjustTime = 0.0
-    for segIndex, segment in enumerate(transcript):
-        segID = segment["id"]
-        if (segID == 0):
-            chunkCount += 1
-            adjustTime  = ((chunkCount - 1) * chunkSeconds)
-                
-#        if (segID == 0)   : segment["text"] += "@@@@@" # TESTING: This is a marker so we know where each new segment is located
-        segment["start"] += adjustTime
-        segment["end"]   += adjustTime
-        segment["id"]     = segIndex # repair the sequence, so the IDs are now contiguous
+    chunkSegments = []
+    for segment in transcript:
+        if (segment["id"] == 0 or not chunkSegments):
+            chunkSegments.append([])
+        chunkSegments[-1].append(segment)
+    if (chunkOffsets is None):
+        chunkOffsets = [(index * chunkSeconds, (index + 1) * chunkSeconds) for index in range(len(chunkSegments))]
+    columns = mergeChunkSegments(chunkSegments, chunkOffsets[:len(chunkSegments)])
+    for segment, segID, start, end in zip(columns.segments, columns.id.tolist(), columns.start.tolist(), columns.end.tolist()):
+        segment["id"], segment["start"], segment["end"] = segID, start, end
     return transcript
     
 
@@ -255,121 +459,1672 @@ def removeTempFiles(filePathArray):
           os.remove(tempFile) #test before trying to delete just in case
 
 
-def transcribeQueuedFile(idx, filePath, shared_list):
-    # Transcribe the file and put the text
-    # and segments into a queue for later use
+#    ____ RUN METRICS ___
+
+class RunMetrics:
+    """
+        Timing spans, chunk progress, queue depth and worker utilization of a
+        run, for when the "Exporting:" and "Completed:" print lines are not
+        enough.
+
+        Every span is emitted as one JSON line to logPath (and/or the stream,
+        e.g. sys.stderr).  The counters are also written in the Prometheus text
+        format to promPath after every chunk, and served on
+        http://127.0.0.1:<promPort>/metrics when a port is given.  "progress"
+        is called with a dict (done, total, cached, fraction, elapsed, eta) after
+        every chunk, so an embedding app can show a progress bar and ETA.
+
+        A RunMetrics without any of these only keeps the totals in memory,
+        which is what transcribeChunks uses when it is not given one.
+    """
+
+    def __init__(self, logPath=None, stream=None, promPath=None, promPort=None, progress=None):
+        self.logFile      = open(logPath, "a", encoding="utf-8") if logPath else None
+        self.stream       = stream
+        self.promPath     = promPath
+        self.progress     = progress
+        self.lock         = threading.Lock()
+        self.started      = timer()
+        self.phaseSeconds = {}  # span name -> total seconds
+        self.phaseCounts  = {}  # span name -> number of spans
+        self.workerBusy   = {}  # worker pid -> seconds spent transcribing
+        self.workerMemory = {}  # worker pid -> processMemory, after the last run
+        self.chunks       = {"total": 0, "done": 0, "cached": 0}
+        self.queueDepth   = 0
+        self.chunkStart   = None
+        self.eta          = None
+        self.server       = None
+        if (promPort is not None):
+            self.serve(promPort)
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        # with metrics.span("decode", file=filePath): ... times the block and records it
+        start = timer()
+        try:
+            yield
+        finally:
+            self.record(name, timer() - start, **fields)
+
+    def record(self, name, seconds, **fields):
+        with self.lock:
+            self.phaseSeconds[name] = self.phaseSeconds.get(name, 0.0) + seconds
+            self.phaseCounts[name]  = self.phaseCounts.get(name, 0) + 1
+        self.emit(dict({"event": "span", "name": name, "seconds": round(seconds, 6)}, **fields))
+
+    def emit(self, event):
+        if (self.logFile is None and self.stream is None):
+            return
+        line = json.dumps(dict({"time": round(time.time(), 6)}, **event), default=str)
+        for outFile in (self.logFile, self.stream):
+            if (outFile is not None):
+                print(line, file=outFile, flush=True)
+
+    def startChunks(self, total, cached=0):
+        # Called once the chunks are known, "cached" of them will not be transcribed
+        with self.lock:
+            self.chunks     = {"total": total, "done": cached, "cached": cached}
+            self.queueDepth = total - cached
+            self.workerBusy = {} # utilization is per run, the workers may not be the same
+            self.chunkStart = timer()
+        self.update()
+
+    def chunkDone(self, index, pid, inferenceSeconds, transferSeconds):
+        with self.lock:
+            self.chunks["done"]  += 1
+            self.queueDepth      -= 1
+            self.workerBusy[pid]  = self.workerBusy.get(pid, 0.0) + inferenceSeconds
+        self.record("chunkInference", inferenceSeconds, chunk=index, pid=pid)
+        self.record("transfer", transferSeconds, chunk=index, pid=pid)
+        self.update()
+
+    def recordWorkerMemory(self, usage):
+        # usage is WhisperWorkerPool.workerMemory(), taken while the workers are still alive
+        with self.lock:
+            self.workerMemory = dict(usage)
+        self.emit({"event": "workerMemory", "workers": {str(pid): memory for pid, memory in usage.items()}})
+
+    def update(self):
+        # Recompute the ETA from the chunks transcribed so far, then report progress
+        with self.lock:
+            done, total, cached = self.chunks["done"], self.chunks["total"], self.chunks["cached"]
+            elapsed  = (timer() - self.chunkStart)
+            self.eta = (elapsed / (done - cached) * (total - done)) if (done > cached) else None
+            report   = {"done": done, "total": total, "cached": cached, "fraction": done / total if total else 1.0,
+                        "elapsed": elapsed, "eta": self.eta, "queueDepth": self.queueDepth}
+        self.emit(dict({"event": "progress"}, **report))
+        if (self.promPath is not None):
+            self.writePrometheus(self.promPath)
+        if (self.progress is not None):
+            self.progress(report)
+
+    def workerUtilization(self):
+        # Busy fraction of each worker since the chunks were queued
+        elapsed = max(timer() - (self.chunkStart or self.started), 1e-9)
+        with self.lock:
+            return {pid: busy / elapsed for pid, busy in self.workerBusy.items()}
+
+    def prometheusText(self):
+        utilization = self.workerUtilization()
+        with self.lock:
+            lines  = ["# HELP whisper_phase_seconds_total Seconds spent in each phase of the run",
+                      "# TYPE whisper_phase_seconds_total counter"]
+            lines += ['whisper_phase_seconds_total{phase="%s"} %.6f' %(name, seconds) for name, seconds in self.phaseSeconds.items()]
+            lines += ["# HELP whisper_chunks Chunks of the current run (total, done, cached)", "# TYPE whisper_chunks gauge"]
+            lines += ['whisper_chunks{state="%s"} %d' %(state, count) for state, count in self.chunks.items()]
+            lines += ["# HELP whisper_queue_depth Chunks queued or being transcribed", "# TYPE whisper_queue_depth gauge",
+                      "whisper_queue_depth %d" %(self.queueDepth)]
+            lines += ["# HELP whisper_eta_seconds Estimated seconds until every chunk is transcribed", "# TYPE whisper_eta_seconds gauge",
+                      "whisper_eta_seconds %.3f" %(self.eta if self.eta is not None else float("nan"))]
+            lines += ["# HELP whisper_worker_busy_seconds_total Seconds each worker spent transcribing", "# TYPE whisper_worker_busy_seconds_total counter"]
+            lines += ['whisper_worker_busy_seconds_total{pid="%s"} %.6f' %(pid, busy) for pid, busy in self.workerBusy.items()]
+        lines += ["# HELP whisper_worker_utilization Busy fraction of each worker", "# TYPE whisper_worker_utilization gauge"]
+        lines += ['whisper_worker_utilization{pid="%s"} %.4f' %(pid, busy) for pid, busy in utilization.items()]
+        with self.lock:
+            lines += ["# HELP whisper_worker_memory_bytes Memory of each worker (rss, pss, shared, private)", "# TYPE whisper_worker_memory_bytes gauge"]
+            lines += ['whisper_worker_memory_bytes{pid="%s",kind="%s"} %d' %(pid, kind, amount)
+                      for pid, memory in self.workerMemory.items() for kind, amount in memory.items()]
+        return "\n".join(lines) + "\n"
+
+    def writePrometheus(self, path):
+        # Atomic, so a node_exporter textfile collector never reads half a file
+        tempPath = "%s.%s.tmp" %(path, os.getpid())
+        with open(tempPath, "w", encoding="utf-8") as outFile:
+            outFile.write(self.prometheusText())
+        os.replace(tempPath, path)
+
+    def serve(self, port):
+        metrics = self
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheusText().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass # keep the request log out of the transcription output
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def close(self):
+        if (self.server is not None):
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if (self.promPath is not None):
+            self.writePrometheus(self.promPath)
+        if (self.logFile is not None):
+            self.logFile.close()
+            self.logFile = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#    ____ PERSISTENT WORKER POOL ___
+
+"""
+    Approximate resident memory of one worker process holding each model, on CPU.
+    Used to keep the pool from asking for more workers than the machine can hold.
+    ("medium.en" x 15 processes will exhaust 16G of RAM)
+"""
+gModelWorkerBytes = {
+    "tiny"   : 0.5 * 1024**3,
+    "base"   : 0.7 * 1024**3,
+    "small"  : 1.5 * 1024**3,
+    "medium" : 3.5 * 1024**3,
+    "large"  : 7.0 * 1024**3,
+}
+
+
+gModelWeightBytes = {
+    "tiny"   : 0.15 * 1024**3,
+    "base"   : 0.28 * 1024**3,
+    "small"  : 0.92 * 1024**3,
+    "medium" : 2.85 * 1024**3,
+    "large"  : 5.75 * 1024**3,
+}
+
+
+def modelWeightBytes(modelName):
+    # Size of the model's weights, measured when it is loaded in this process, otherwise looked up
+    if (modelName in gWhisperModels):
+        return sum(parameter.numel() * parameter.element_size() for parameter in gWhisperModels[modelName].parameters())
+    baseName = (modelName or "base").split(".")[0].split("-")[0] # "small.en" and "small" use the same amount of memory
+    return gModelWeightBytes.get(baseName, gModelWeightBytes["large"])
+
+
+def modelWorkerBytes(modelName, sharedWeights=False):
+    """
+        Resident memory of one worker holding the model.  Measured from the
+        weights when the model is loaded in this process (the weights plus the
+        activations and the torch runtime), otherwise looked up.
+
+        With sharedWeights the weights are mapped once for every worker (see
+        shareModelWeights), so they are not part of each worker's cost.
+    """
+    if (modelName in gWhisperModels):
+        workerBytes = int(modelWeightBytes(modelName) * 1.25 + 350 * 1024**2)
+    else:
+        baseName    = (modelName or "base").split(".")[0].split("-")[0]
+        workerBytes = gModelWorkerBytes.get(baseName, gModelWorkerBytes["large"])
+    if sharedWeights:
+        workerBytes -= modelWeightBytes(modelName)
+    return workerBytes
+
+
+def readFirstLine(path):
+    try:
+        with open(path) as openFile:
+            return openFile.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroupMemoryBytes():
+    # Memory left under this process's cgroup limit (containers), None when there is no limit
+    for limitPath, usagePath in (("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),                             # cgroup v2
+                                 ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes")): # cgroup v1
+        limit = readFirstLine(limitPath)
+        if (limit is None):
+            continue
+        if (limit == "max" or int(limit) >= 2**60): # no limit set
+            return None
+        usage = readFirstLine(usagePath)
+        return max(int(limit) - int(usage or 0), 0)
+    return None
+
+
+def availableMemoryBytes():
+    # Memory that can be used without swapping (or being OOM killed), None if it can not be determined
+    memoryBytes = None
+    try:
+        with open("/proc/meminfo") as memInfo:
+            for line in memInfo:
+                if line.startswith("MemAvailable:"):
+                    memoryBytes = int(line.split()[1]) * 1024
+    except OSError:
+        try:
+            memoryBytes = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") # not Linux, macOS has no SC_AVPHYS_PAGES, use total
+        except (ValueError, OSError, AttributeError):
+            pass
+    cgroupBytes = cgroupMemoryBytes()
+    if (cgroupBytes is not None):
+        memoryBytes = cgroupBytes if memoryBytes is None else min(memoryBytes, cgroupBytes)
+    return memoryBytes
+
+
+def usableCPUs():
+    # CPUs this process may run on: its affinity and its cgroup CPU quota, not just the CPUs built in
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = multiprocessing.cpu_count() # macOS
+    quota = readFirstLine("/sys/fs/cgroup/cpu.max") # cgroup v2: "quota period" or "max period"
+    if (quota is not None and not quota.startswith("max")):
+        quota, period = quota.split()[:2]
+        cpus = min(cpus, max(int(int(quota) / int(period)), 1))
+    else:
+        quota  = readFirstLine("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") # cgroup v1
+        period = readFirstLine("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if (quota is not None and period is not None and int(quota) > 0):
+            cpus = min(cpus, max(int(int(quota) / int(period)), 1))
+    return cpus
+
+
+"""
+    The decision of autoTuneWorkers, logged with the "Processes Used" summary
+"""
+WorkerTuning = namedtuple("WorkerTuning", ["processCount", "threadsPerWorker", "workerBytes", "memoryBytes", "usableCPUs", "limitedBy", "sharedWeights"])
+
+
+def autoTuneWorkers(modelName, requestedProcs=None, memoryHeadroom=0.9, sharedWeights=False):
+    """
+        Choose the number of workers and the torch intra-op threads of each,
+        for the most throughput without swapping or being OOM killed:
+
+        - no more workers than usable CPUs (affinity and cgroup quota)
+        - no more workers than copies of the model that fit in memoryHeadroom
+          of the available memory (system and cgroup limit), with
+          sharedWeights only one copy of the weights is needed for all of them
+        - the usable CPUs are divided between the workers as threads, so
+          fewer workers of a large model still use every core
+    """
+    cpus        = usableCPUs()
+    targetProcs = cpus if requestedProcs is None else max(requestedProcs, 1)
+    limitedBy   = "request"
+    if (targetProcs > cpus):
+        targetProcs = cpus
+        limitedBy   = "CPUs"
+    workerBytes = modelWorkerBytes(modelName, sharedWeights)
+    memoryBytes = availableMemoryBytes()
+    if (memoryBytes is not None):
+        usableBytes = memoryBytes * memoryHeadroom
+        if (sharedWeights and modelName not in gWhisperModels):
+            usableBytes -= modelWeightBytes(modelName) # the one shared copy is not loaded yet
+        memoryProcs = max(int(usableBytes // workerBytes), 1)
+        if (memoryProcs < targetProcs):
+            targetProcs = memoryProcs
+            limitedBy   = "memory"
+    threadsPerWorker = max(cpus // targetProcs, 1)
+    return WorkerTuning(targetProcs, threadsPerWorker, workerBytes, memoryBytes, cpus, limitedBy, sharedWeights)
+
+
+def describeTuning(tuning):
+    gigabyte    = 1024**3
+    memoryStr   = "unknown" if tuning.memoryBytes is None else "%.1f GB" %(tuning.memoryBytes / gigabyte)
+    sharedStr   = ", weights shared" if tuning.sharedWeights else ""
+    return "%s processes x %s threads, %.2f GB per worker%s, %s available, %s usable CPUs (limited by %s)" %(
+        tuning.processCount, tuning.threadsPerWorker, tuning.workerBytes / gigabyte, sharedStr, memoryStr, tuning.usableCPUs, tuning.limitedBy)
+
+
+def shareModelWeights(modelName):
+    """
+        Move the weights of the model into one shared memory region, which the
+        forked workers map instead of each ending up with a private copy.
+
+        Pages inherited through a fork are only shared until they are written,
+        and Python reference counts and torch touch enough of the model to copy
+        it page by page into every worker.  The region is an anonymous shared
+        mapping: every tensor is a view of it, no worker gets a private copy,
+        and a single mapping needs no file descriptor per tensor (torch's
+        share_memory would keep one open for every weight).
+    """
+    if (modelName in gSharedWeights):
+        return gSharedWeights[modelName]
+    import torch
+    model   = getWhisperModel(modelName)
+    tensors = {} # id -> (tensor, offset), a tensor used by two modules is moved once
+    size    = 0
+    for module in model.modules():
+        for tensor in list(module._parameters.values()) + list(module._buffers.values()):
+            if (tensor is None or tensor.layout != torch.strided or id(tensor) in tensors):
+                continue # e.g. the sparse alignment_heads buffer
+            tensors[id(tensor)] = (tensor, size)
+            size += (tensor.numel() * tensor.element_size() + 63) // 64 * 64 # keep each view 64-byte aligned
+    region = mmap.mmap(-1, max(size, 1)) # MAP_SHARED | MAP_ANONYMOUS, inherited by every fork
+    shared = torch.frombuffer(region, dtype=torch.uint8)
+    views  = {}
+    for key, (tensor, offset) in tensors.items():
+        view = shared[offset : offset + tensor.numel() * tensor.element_size()].view(tensor.dtype).view(tensor.shape)
+        view.copy_(tensor.detach())
+        views[key] = view
+    for module in model.modules():
+        for name, parameter in module._parameters.items():
+            if (parameter is not None and id(parameter) in views):
+                parameter.data = views[id(parameter)]
+        for name, buffer in module._buffers.items():
+            if (buffer is not None and id(buffer) in views):
+                module._buffers[name] = views[id(buffer)]
+    gSharedWeights[modelName] = region
+    return region
+
+
+def processMemory(pid):
+    """
+        Memory of a process in bytes: "rss" (every resident page), "pss" (shared
+        pages divided between the processes that map them), "shared" and
+        "private".  Read from /proc/<pid>/smaps_rollup, None where it is not
+        available (not Linux, or the process is gone).
+    """
+    fields = {}
+    try:
+        with open("/proc/%s/smaps_rollup" %(pid)) as rollup:
+            for line in rollup:
+                parts = line.split()
+                if (len(parts) == 3 and parts[2] == "kB"):
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {"rss"     : fields.get("Rss", 0),
+            "pss"     : fields.get("Pss", 0),
+            "shared"  : fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+            "private" : fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)}
+
+
+def exitWithParent(parentPid, interval=1.0):
+    # Watch the parent from a thread of the worker, and end the worker as soon as the parent is gone (killed outright),
+    # instead of letting the orphan finish a unit of up to 10 minutes first
+    def watchParent():
+        while (os.getppid() == parentPid):
+            time.sleep(interval)
+        os._exit(1)
+    threading.Thread(target=watchParent, name="parentWatchdog", daemon=True).start()
+
+
+def poolWorker(modelName, threadsPerWorker, connection, parentPid):
+    """
+        The body of each long-lived worker.  The model is loaded once (or inherited
+        from the parent through the fork) and kept for every job this worker runs.
+        Jobs are (jobId, target, args) tuples sent by the parent on this worker's
+        own pipe, one at a time, and None is the request to exit.  The result is
+        sent back on the same pipe, so a worker that dies (e.g. killed when memory
+        runs out) takes no lock or other worker's job with it.  If the parent is
+        killed outright the worker exits within a second (see exitWithParent),
+        even in the middle of a job.
+    """
+    import torch
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the parent handles Ctrl-C and shuts the pool down
+    for signalName in ("SIGTERM", "SIGHUP"):
+        if hasattr(signal, signalName):
+            signal.signal(getattr(signal, signalName), signal.SIG_DFL) # not the parent's (or the host's) handler, terminate() must end the worker
+    exitWithParent(parentPid)
+    torch.set_num_threads(threadsPerWorker)
+    if (modelName is not None and gWhisperModelName != modelName):
+        loadWhisperModel(modelName)
+
+    while True:
+        if (not connection.poll(1.0)):
+            continue
+        try:
+            job = connection.recv()
+        except EOFError:
+            break # the parent closed the pipe
+        if (job is None):
+            break
+        jobId, target, args = job
+        try:
+            connection.send((jobId, True, target(*args)))
+        except Exception:
+            connection.send((jobId, False, traceback.format_exc()))
+
+
+class WhisperWorkerPool:
+    """
+        A set of forked worker processes that live across files and runs.
+
+        Each worker keeps its Whisper model loaded, so transcribing many files
+        (or running performanceTest) does not pay to fork and tear down a
+        process for every chunk.  Jobs from any number of files can be
+        submitted; results are returned by job id.
+
+        with WhisperWorkerPool("base.en", 8) as pool:
+            transcribeChunks("base.en", targetPath, outDirectory, 8, pool=pool)
+
+        Jobs wait in the parent until a worker is idle, and each worker is
+        sent one job at a time on its own pipe, so the parent always knows
+        which job each worker runs.  Jobs are handed out whenever the pool is
+        used (submit, completed, poll).
+
+        The workers exit when the pool is shut down, when the parent exits or
+        is terminated, and on their own if the parent is killed outright.
+        A worker that dies while the pool is running (killed when memory runs
+        out, a crash in native code) is replaced, and its job is submitted
+        again once; if the job is lost a second time it fails.
+
+        With shareWeights (the default) the model's weights are placed in one
+        shared memory region before the workers are forked, so the workers do
+        not each hold a copy of them and more workers fit in memory (see
+        shareModelWeights and workerMemory).
+    """
+
+    def __init__(self, modelName=None, processCount=None, shareWeights=True):
+        self.modelName    = modelName
+        self.requested    = processCount
+        self.shareWeights = shareWeights and (modelName is not None)
+        self.tuning       = autoTuneWorkers(modelName, processCount, sharedWeights=self.shareWeights) # tuned again once the model is loaded
+        self.processCount = self.tuning.processCount
+        self.workers      = []
+        self.connections  = {} # worker -> the parent's end of its pipe
+        self.running      = {} # worker -> id of the job it was sent
+        self.waiting      = deque() # ids of submitted jobs not sent to a worker yet, in order
+        self.outstanding  = {} # jobId -> (target, args) of jobs submitted and not received yet
+        self.retried      = set() # jobs already submitted again after their worker died
+        self.finished     = {} # results received for jobs that have not been collected yet
+        self.nextJobId    = 0
+        self.parentPid    = os.getpid()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, excTraceback):
+        self.shutdown()
+
+    def start(self):
+        if (self.modelName is not None and gWhisperModelName != self.modelName):
+            loadWhisperModel(self.modelName) # load once in the parent, the workers inherit it through the fork
+        if self.shareWeights:
+            shareModelWeights(self.modelName)
+        if (not self.workers):
+            self.tuning       = autoTuneWorkers(self.modelName, self.requested, sharedWeights=self.shareWeights) # the model's size can now be measured
+            self.processCount = self.tuning.processCount
+        installShutdownHandlers()
+        gLivePools.add(self)
+        self.addWorkers(self.processCount - len(self.workers))
+        return self
+
+    def addWorkers(self, count):
+        resource_tracker.ensure_running() # workers must share the parent's tracker for SharedAudioBuffer
+        gc.collect() # nothing collectable is frozen with the rest
+        gc.freeze()  # the workers' collector would otherwise write to (and so copy) the pages of every object they inherit
+        try:
+            for _ in range(count):
+                parentEnd, workerEnd = gForkContext.Pipe()
+                worker = gForkContext.Process(target=poolWorker, args=(self.modelName, self.tuning.threadsPerWorker, workerEnd, self.parentPid), daemon=True)
+                worker.start()
+                workerEnd.close() # only the worker holds it, so the parent reads EOF when the worker dies
+                self.workers.append(worker)
+                self.connections[worker] = parentEnd
+        finally:
+            gc.unfreeze() # only the workers keep the frozen generation, the parent collects as usual
+        self.dispatch()
+
+    def submit(self, target, *args):
+        # Queue target(*args) to run in a worker, target must be a module level function
+        if (not self.workers):
+            self.start()
+        jobId           = self.nextJobId
+        self.nextJobId += 1
+        self.outstanding[jobId] = (target, args)
+        self.waiting.append(jobId)
+        self.dispatch()
+        return jobId
+
+    def dispatch(self):
+        # Send the waiting jobs, in order, to the idle workers
+        for worker in self.workers:
+            while (self.waiting and worker not in self.running and worker.exitcode is None):
+                jobId = self.waiting.popleft()
+                if (jobId not in self.outstanding):
+                    continue # cancelled
+                try:
+                    self.connections[worker].send((jobId,) + self.outstanding[jobId])
+                except (OSError, EOFError):
+                    self.waiting.appendleft(jobId) # the worker died, the job goes to another one
+                    break
+                self.running[worker] = jobId
+
+    def completed(self, jobIds, errors=False):
+        # Yield (jobId, result) for each of the jobs, in the order they finish; with errors, a failed job yields its RuntimeError instead of raising it
+        pending = set(jobIds)
+        while pending:
+            for jobId in pending & self.finished.keys():
+                pending.discard(jobId)
+                yield jobId, self.takeResult(jobId, raiseError=not errors)
+            pending &= self.outstanding.keys() # cancelled meanwhile, they never finish
+            if (not pending):
+                break
+            self.receive(1.0)
+
+    def poll(self, jobIds, timeout=0.0):
+        # (jobId, result) of those of the jobs that have finished, waiting up to timeout seconds for one if none has
+        pending  = set(jobIds)
+        deadline = time.monotonic() + timeout
+        while self.receive(0.0): # everything that has arrived already
+            pass
+        while (not (pending & self.finished.keys())):
+            remaining = (deadline - time.monotonic())
+            if (remaining <= 0):
+                break
+            self.receive(min(remaining, 1.0))
+        return [(jobId, self.takeResult(jobId)) for jobId in sorted(pending & self.finished.keys())]
+
+    def receive(self, timeout, checkWorkers=True):
+        # Take the results that arrive within timeout seconds into self.finished; when there are none, look after dead workers
+        workerOf  = {connection: worker for worker, connection in self.connections.items()}
+        sentinels = [worker.sentinel for worker in self.workers] if checkWorkers else []
+        ready     = multiprocessing.connection.wait(list(workerOf) + sentinels, max(timeout, 0.0)) # a worker's exit ends the wait too
+        received  = False
+        for connection in ready:
+            if (connection not in workerOf):
+                continue # a sentinel
+            try:
+                jobId, succeeded, result = connection.recv()
+            except (OSError, EOFError):
+                continue # the worker died, replaceDeadWorkers takes care of it
+            self.running.pop(workerOf[connection], None)
+            if (self.outstanding.pop(jobId, None) is not None): # not a late result of a job that was submitted again, or cancelled
+                self.finished[jobId] = (succeeded, result)
+            received = True
+        if (not received and checkWorkers):
+            self.replaceDeadWorkers()
+        self.dispatch()
+        return received
+
+    def replaceDeadWorkers(self):
+        # Start a worker in place of each one that died, and submit its job again (once)
+        dead = [worker for worker in self.workers if worker.exitcode is not None]
+        if (not dead):
+            return
+        while self.receive(0.0, checkWorkers=False): # results the dead workers sent before dying
+            pass
+        for worker in dead:
+            self.workers.remove(worker)
+            self.connections.pop(worker).close()
+            jobId = self.running.pop(worker, None)
+            if (jobId not in self.outstanding):
+                print("Worker Exited:    pid %s, exit code %s, between jobs; a new worker is started" %(worker.pid, worker.exitcode))
+            elif (jobId in self.retried):
+                self.outstanding.pop(jobId)
+                self.finished[jobId] = (False, "The worker running this job (pid %s) exited with code %s, as did the worker that ran it before."
+                                               %(worker.pid, worker.exitcode))
+            else:
+                self.retried.add(jobId)
+                self.waiting.appendleft(jobId)
+                print("Worker Exited:    pid %s, exit code %s, job %s submitted again; a new worker is started" %(worker.pid, worker.exitcode, jobId))
+        self.addWorkers(len(dead))
+
+    def cancel(self, jobIds):
+        # Forget the jobs, e.g. those left when a file failed: the ones not sent to a worker are never run, and the results of the running ones are dropped
+        jobIds = set(jobIds)
+        for jobId in jobIds:
+            self.outstanding.pop(jobId, None)
+            self.finished.pop(jobId, None)
+            self.retried.discard(jobId)
+        self.waiting = deque(jobId for jobId in self.waiting if jobId not in jobIds)
+
+    def gather(self, jobIds):
+        # Wait for the jobs and return their results in the order of jobIds
+        results = dict(self.completed(jobIds))
+        return [results[jobId] for jobId in jobIds]
+
+    def workerMemory(self):
+        # processMemory of each live worker, by pid
+        usage = {worker.pid: processMemory(worker.pid) for worker in self.workers if worker.is_alive()}
+        return {pid: memory for pid, memory in usage.items() if memory is not None}
+
+    def workerPeakRssBytes(self):
+        # Peak resident memory of each live worker (Linux; an empty list where /proc is not available)
+        peaks = []
+        for worker in self.workers:
+            try:
+                with open("/proc/%s/status" %(worker.pid)) as status:
+                    peaks.extend(int(line.split()[1]) * 1024 for line in status if line.startswith("VmHWM:"))
+            except OSError:
+                pass
+        return peaks
+
+    def takeResult(self, jobId, raiseError=True):
+        succeeded, result = self.finished.pop(jobId)
+        if succeeded:
+            return result
+        error = RuntimeError("Pool job %s failed in a worker:\n%s" %(jobId, result))
+        if raiseError:
+            raise error
+        return error
+
+    def shutdown(self, timeout=5.0):
+        if (os.getpid() != self.parentPid):
+            return # only the parent owns the workers
+        for worker in self.workers:
+            try:
+                self.connections[worker].send(None)
+            except (OSError, EOFError):
+                pass # already gone
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+            if worker.is_alive():
+                worker.terminate() # busy with a job, do not leave it running
+                worker.join()
+            self.connections[worker].close()
+        self.workers     = []
+        self.connections = {}
+        self.running     = {}
+        self.waiting     = deque() # jobs not sent yet are dropped, nothing is left for the next start
+        self.outstanding = {}
+        self.retried     = set()
+        gLivePools.discard(self)
+
+
+def shutdownAllPools():
+    for pool in list(gLivePools):
+        pool.shutdown(timeout=1.0)
+
+
+def terminationHandler(signum, frame):
+    # Take the workers down with the parent, then do what the previous handler would have done
+    shutdownAllPools()
+    previousHandler = gPreviousHandlers.get(signum, signal.SIG_DFL)
+    if callable(previousHandler):
+        previousHandler(signum, frame) # the host's own handler
+        return
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum) # terminate as we would have
+
+
+gShutdownHandlersInstalled = False
+gPreviousHandlers          = {} # signal number -> the handler terminationHandler replaced, called after the pools are shut down
+
+def installShutdownHandlers():
+    global gShutdownHandlersInstalled
+    if gShutdownHandlersInstalled:
+        return
+    atexit.register(shutdownAllPools)
+    try:
+        for signalName in ("SIGTERM", "SIGHUP"):
+            signum          = getattr(signal, signalName, None)
+            previousHandler = signal.getsignal(signum) if (signum is not None) else None
+            if (previousHandler is None or previousHandler == signal.SIG_IGN):
+                continue # no such signal, ignored, or a handler installed outside Python we cannot chain to (atexit covers a normal exit)
+            gPreviousHandlers[signum] = previousHandler
+            signal.signal(signum, terminationHandler)
+    except (ValueError, AttributeError):
+        pass # not the main thread (e.g. embedded)
+    gShutdownHandlersInstalled = True
+
+
+#    ____ IN-MEMORY CHUNKS ___
+
+gSampleRate = 16000 # Whisper consumes 16 kHz mono float32 samples (whisper.audio.SAMPLE_RATE)
+
+"""
+    A chunk of a SharedAudioBuffer, small enough to send to a worker
+    "name" is the shared memory block, "start" and "end" are sample indexes
+"""
+SharedChunk = namedtuple("SharedChunk", ["name", "sampleCount", "start", "end", "label"])
+
+
+def decodeAudio(filePath):
+    # Decode the input once (through ffmpeg) into 16 kHz mono float32 samples
+    import whisper.audio
+    return whisper.audio.load_audio(filePath)
+
+
+class SharedAudioBuffer:
+    """
+        Decoded samples in shared memory.  The pool's workers were forked before
+        the audio was decoded, so they cannot inherit it; instead each worker
+        attaches to the block by name and transcribes a view of its chunk.
+        Nothing is copied to the worker and nothing is written to disk.
+    """
+
+    def __init__(self, sampleCount, name=None):
+        self.sampleCount = sampleCount
+        self.memory      = shared_memory.SharedMemory(name=name, create=(name is None), size=max(sampleCount, 1) * 4)
+        self.samples     = numpy.ndarray((sampleCount,), dtype=numpy.float32, buffer=self.memory.buf)
+
+    @classmethod
+    def fromSamples(cls, samples):
+        sharedAudio            = cls(len(samples))
+        sharedAudio.samples[:] = samples
+        return sharedAudio
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def chunk(self, start, end, label):
+        return SharedChunk(self.name, self.sampleCount, start, end, label)
+
+    def close(self):
+        self.samples = None
+        try:
+            self.memory.close()
+        except BufferError:
+            pass # a view is still referenced (e.g. by a traceback), the mapping goes when it does
+
+    def unlink(self):
+        self.close()
+        self.memory.unlink()
+
+
+def equalChunkRanges(sampleCount, chunkCount):
+    # (start, end) sample indexes of chunkCount equal chunks, the last one takes the remainder
+    bounds = [(sampleCount * index) // chunkCount for index in range(chunkCount + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def planChunkBoundaries(samples, chunkCount, sampleRate=gSampleRate, toleranceSeconds=5.0, frameSeconds=0.025, pauseSeconds=0.3):
+    """
+        Choose where to split the audio so that each cut lands in a pause
+        instead of in the middle of a word (see caveats 2 and 3 in the readme).
+
+        The short-time energy of every frame is computed in one vectorized pass
+        and smoothed over pauseSeconds.  For each of the ideal, equal-length
+        split points we take the quietest point within toleranceSeconds of it,
+        preferring the nearer point when two are about as quiet, so the chunks
+        stay close to equal length and the parallel speedup is kept.
+
+        Returns (start, end) sample indexes for each chunk.
+    """
+    frameSamples = max(int(frameSeconds * sampleRate), 1)
+    frameCount   = len(samples) // frameSamples
+    if (chunkCount <= 1 or frameCount < chunkCount):
+        return equalChunkRanges(len(samples), chunkCount)
+
+    frames      = numpy.asarray(samples[:frameCount * frameSamples], dtype=numpy.float32).reshape(frameCount, frameSamples)
+    energyDb    = 10.0 * numpy.log10(numpy.einsum("ij,ij->i", frames, frames) / frameSamples + 1e-10)
+    smoothWidth = max(int(pauseSeconds / frameSeconds), 1)
+    energyDb    = numpy.convolve(energyDb, numpy.ones(smoothWidth) / smoothWidth, mode="same")
+    tolFrames   = max(int(toleranceSeconds / frameSeconds), 1)
+    distancePen = 0.1 # dB for each second away from the ideal point
+
+    bounds = [0]
+    for index in range(1, chunkCount):
+        idealFrame = (frameCount * index) // chunkCount
+        lowFrame   = max(idealFrame - tolFrames, (bounds[-1] // frameSamples) + 1)
+        highFrame  = min(idealFrame + tolFrames, frameCount - 1)
+        if (lowFrame > highFrame):
+            bounds.append(idealFrame * frameSamples)
+            continue
+        candidates = numpy.arange(lowFrame, highFrame + 1)
+        score      = energyDb[lowFrame:highFrame + 1] + numpy.abs(candidates - idealFrame) * frameSeconds * distancePen
+        bounds.append(int(candidates[numpy.argmin(score)]) * frameSamples)
+    bounds.append(len(samples))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def transcribeSharedChunk(chunk, wordTimestamps=False):
+    # Transcribe a view of the shared samples, the same way transcribeFile does for a file
+    start       = timer()
+    sharedAudio = SharedAudioBuffer(chunk.sampleCount, chunk.name)
+    try:
+        result = gWhisperModel.transcribe(sharedAudio.samples[chunk.start:chunk.end], **transcribeOptions(wordTimestamps))
+    finally:
+        sharedAudio.close()
+    end      = timer()
+    elapsStr = "{:0>3.3f}".format(end - start)
+    print("Completed:        %s in %s seconds" %(chunk.label, elapsStr)) # for testing purposes
+    return {"text": result["text"], "segments": result["segments"]}
+
+
+#    ____ RESULT TRANSPORT ___
+
+gSegmentFloatKeys = ["start", "end", "temperature", "avg_logprob", "compression_ratio", "no_speech_prob"]
+gSegmentIntKeys   = ["id", "seek"]
+
+
+def packSegments(segments):
+    """
+        Pack Whisper's list of segment dictionaries into columns, so a worker
+        sends a handful of arrays instead of pickling a dictionary (and a list
+        of tokens) for every segment:
+
+        numeric fields  -> one numpy array per field
+        tokens          -> one flat int32 array plus the token count of each segment
+        text            -> one string plus the length of each segment's text
+        anything else   -> kept per segment in "extra" (e.g. "words")
+    """
+    knownKeys = set(gSegmentFloatKeys + gSegmentIntKeys + ["tokens", "text"])
+    packed    = {"count": len(segments)}
+    for key in gSegmentFloatKeys:
+        packed[key] = numpy.array([segment.get(key, 0.0) for segment in segments], dtype=numpy.float64)
+    for key in gSegmentIntKeys:
+        packed[key] = numpy.array([segment.get(key, 0) for segment in segments], dtype=numpy.int64)
+    tokenLists            = [segment.get("tokens", []) for segment in segments]
+    packed["tokens"]      = numpy.fromiter((token for tokens in tokenLists for token in tokens), dtype=numpy.int32)
+    packed["tokenCounts"] = numpy.array([len(tokens) for tokens in tokenLists], dtype=numpy.int32)
+    texts                 = [segment.get("text", "") for segment in segments]
+    packed["text"]        = "".join(texts)
+    packed["textLengths"] = numpy.array([len(text) for text in texts], dtype=numpy.int64)
+    extra                 = [{key: value for key, value in segment.items() if key not in knownKeys} for segment in segments]
+    packed["extra"]       = extra if any(extra) else None
+    return packed
+
+
+def unpackSegments(packed):
+    # Rebuild the segment dictionaries from packSegments, with plain Python values (json.dump needs them)
+    columns      = {key: packed[key].tolist() for key in gSegmentFloatKeys + gSegmentIntKeys}
+    tokenEnds    = numpy.cumsum(packed["tokenCounts"]).tolist()
+    textEnds     = numpy.cumsum(packed["textLengths"]).tolist()
+    tokens       = packed["tokens"].tolist()
+    text         = packed["text"]
+    segments     = []
+    tokenStart   = 0
+    textStart    = 0
+    for index in range(packed["count"]):
+        segment = {"id": columns["id"][index], "seek": columns["seek"][index], "start": columns["start"][index], "end": columns["end"][index],
+                   "text": text[textStart:textEnds[index]], "tokens": tokens[tokenStart:tokenEnds[index]]}
+        for key in gSegmentFloatKeys[2:]:
+            segment[key] = columns[key][index]
+        if (packed["extra"] is not None):
+            segment.update(packed["extra"][index])
+        segments.append(segment)
+        tokenStart = tokenEnds[index]
+        textStart  = textEnds[index]
+    return segments
+
+
+def transcribeSource(source, wordTimestamps=False):
+    # A chunk is a file on disk, a SharedChunk or a FeatureChunk, the segments are packed for the trip back to the parent
+    start = timer()
+    if isinstance(source, FeatureChunk):
+        result = transcribeFeatures([featureChunkFrames(source)], wordTimestamps=wordTimestamps)[0] # log-mel frames, only our decoder takes them
+        print("Completed:        %s in %s seconds" %(source.label, "{:0>3.3f}".format(timer() - start))) # for testing purposes
+    elif isinstance(source, SharedChunk):
+        result = transcribeSharedChunk(source, wordTimestamps)
+    else:
+        result = transcribeFile(source, wordTimestamps)
+    seconds = (timer() - start)
+    return {"text": result["text"], "segments": packSegments(result["segments"]),
+            "pid": os.getpid(), "seconds": seconds, "finished": time.time()} # for RunMetrics
+
+
+def transcribeFile(filePath, wordTimestamps=False):
+    # Transcribe the file with the model held by
+    # this process and return the text and segments
     start    = timer()
-    result   = gWhisperModel.transcribe(filePath,  fp16=False) # prevent complaint with fp16=False on CPU
+    result   = gWhisperModel.transcribe(filePath, **transcribeOptions(wordTimestamps))
     end      = timer()
     elapsed  = (end - start)
     _,name   = os.path.split(filePath)
     elapsStr = "{:0>3.3f}".format(elapsed)
     print("Completed:        %s in %s seconds" %(name, elapsStr)) # for testing purposes
-    
+    return {"text": result["text"], "segments": result["segments"]}
+
+
+def transcribeOptions(wordTimestamps=False):
+    # The options of whisper's transcribe, with the time of each word when it is needed (merging overlapped chunks)
+    return dict(gTranscribeOptions, word_timestamps=True) if wordTimestamps else gTranscribeOptions
+
+
+def transcribeParallel(filePaths, pool=None, metrics=None, batchSize=1):
     """
-        ------ Hard-won, very painful lesson about shared memory here
-        Note this is an incoming list\array of dictionaries [{"idx": idx, "text": "", "segments": []}]
-        https://docs.python.org/2/library/multiprocessing.html#multiprocessing.managers.SyncManager.list
+        Transcribe the chunks (files or SharedChunks) in parallel and return
+        the concatenated text and segments, in the order of filePaths.
+
+        Results come back from the workers over their pipes to the pool, each
+        tagged with its job id, as compact packed segments (see packSegments).
+        There is no Manager server process and no shared list to re-assign.
+        Pass a RunMetrics to follow the progress and timing of each chunk.
+
+        With batchSize > 1 each worker takes batchSize chunks at a time and
+        decodes them together (see transcribeBatched), so processes and
+        batching can be combined for the best throughput per core.
     """
-    
-    tempDict             = shared_list[idx]
-    tempDict["text"]     = result["text"]
-    tempDict["segments"] = result["segments"]
-    shared_list[idx]     = tempDict # <<-- ***MUST REASSIGN or memory will not update.***  See note
-    
+    if (pool is not None):
+        return transcribePooled(filePaths, pool, metrics, batchSize)
+    with WhisperWorkerPool(gWhisperModelName, len(filePaths)) as pool:
+        return transcribePooled(filePaths, pool, metrics, batchSize)
+
+
+def knownChunkResults(chunkCount, cache=None, cacheKeys=None, checkpointed=None):
+    # (text, segments) of each chunk that is checkpointed (checkpointed is JobCheckpoints.completed()) or in the cache, None for the chunks to transcribe
+    known = []
+    for index in range(chunkCount):
+        checkpoint = checkpointed.get(index) if (checkpointed is not None) else None
+        cached     = cache.get(cacheKeys[index]) if (cache is not None and checkpoint is None) else None
+        known.append(checkpoint if (checkpoint is not None) else (cached["text"], cached["segments"]) if (cached is not None) else None)
+    return known
+
+
+def transcribeChunkResults(filePaths, pool, cache=None, cacheKeys=None, metrics=None, batchSize=1, checkpoints=None, writer=None, wordTimestamps=False, known=None):
     """
-        Queues were originally working perfectly then without warning, they began to
-        producing zombie processes and the program would not complete.
-        
-        Also, on macOS, you cant get the queue size because "qsize" is "not implemented", so you cant test the queue.
-        https://stackoverflow.com/questions/65609529/python-multiprocessing-queue-notimplementederror-macos
-        
-        My alternative was to use a shared memory list.  More specifically, a list of dictionaries.
-        
-        For posterity, here is what does not work.
-        
-        shared_list[idx].update(dictToUpdate)       <- shared memory does not update
-        shared_list[idx]["text"] = result["text"]   <- shared memory does not update
-        
-        This works
-        shared_list.append({"idx": idx, "text": text, "segments":segm})  <- This works but...
-        
-        Appending DOES write back to shared memory but we must start with an empty list and
-        we must manage the order of the data by post-processing because the method is pretty
-        much guaranteed to append out of order, depending upon how long the transcribe process
-        takes.  Its not horrible, we would just need to sort the dictionaries by the "idx" key
-        to get them in the desired order.
-        
-        According to the Python docs, this works and it is working in this program
-        
-        https://docs.python.org/2/library/multiprocessing.html#multiprocessing.managers.SyncManager.list
-        
-        "multiprocessing.managers.ListProxy"
-        
-        "Note: Modifications to mutable values or items in dict and list proxies will not be propagated
-        through the manager, because the proxy has no way of knowing when its values or items are modified.
-        To modify such an item, you can re-assign the modified object to the container proxy:"
+        Transcribe the files (or SharedChunks) with the long-lived workers of
+        the pool, and return (text, segments) of each, in the order of filePaths.
+
+        With a TranscriptCache (and the cache key of each chunk) chunks found in
+        the cache are not transcribed, and every other chunk is stored in the
+        cache as soon as it completes.
+
+        With a RunMetrics the worker, inference and transfer time of every
+        chunk is recorded and progress is reported as each one completes.
+
+        With batchSize > 1 each job is batchSize chunks, decoded together.
+
+        With the JobCheckpoints of a JobJournal, chunks that have a checkpoint
+        are not transcribed again, and every other chunk is checkpointed as
+        soon as it completes.
+
+        With a TranscriptWriter each chunk is handed to it as soon as it
+        completes, and written once the chunks before it are.
+
+        With wordTimestamps each segment comes back with its words and their times.
+
+        "known" is the result of knownChunkResults when the caller has already
+        looked the chunks up (e.g. to export only the others), otherwise the
+        checkpoints and cache are looked up here.  Every chunk without a known
+        result is transcribed, so filePaths must hold a source for each of them.
     """
-    
-    
-def transcribeParallel(filePaths):
-    # Create new transcription processes
-    # that will be executed in parallel
-    processes   = []
-    manager     = Manager()
-    shared_list = manager.list()
-
-    for idx, filePath in enumerate(filePaths):
-        tempDict = {"idx": idx, "text": "", "segments": []} # pre-populat the list with dictionaries
-        shared_list.append(tempDict) # ensure the array index exist, which is already in order
-        process = Process(target=transcribeQueuedFile, args=(idx, filePath, shared_list))
-        processes.append(process)
-
-    for p in processes:
-        p.start()
-
-    for p in processes:
-        p.join()
-    
+    metrics      = metrics or RunMetrics()
+    chunkResults = list(known) if (known is not None) else knownChunkResults(len(filePaths), cache, cacheKeys, checkpoints.completed() if (checkpoints is not None) else None)
+    pending      = [index for index, result in enumerate(chunkResults) if result is None]
+    if (cache is not None):
+        print("Cache Hits:       %s of %s chunks" %(len(filePaths) - len(pending), len(filePaths)))
+    metrics.startChunks(len(filePaths), cached=len(filePaths) - len(pending))
+    if (writer is not None):
+        for index, result in enumerate(chunkResults):
+            if (result is not None):
+                writer.add(index, *result)
+    jobIndexes = {} # jobId -> the indexes of its chunks
+    for first in range(0, len(pending), batchSize):
+        group = pending[first : first + batchSize]
+        jobIndexes[pool.submit(transcribeSources, [filePaths[index] for index in group], batchSize > 1, wordTimestamps)] = group
+    try:
+        for jobId, results in pool.completed(list(jobIndexes)):
+            for index, result in zip(jobIndexes[jobId], results):
+                chunkResults[index] = (result["text"], unpackSegments(result["segments"]))
+                metrics.chunkDone(index, result["pid"], result["seconds"], time.time() - result["finished"]) # transfer includes unpacking
+                if (checkpoints is not None):
+                    checkpoints.put(index, *chunkResults[index])
+                if (cache is not None):
+                    cache.put(cacheKeys[index], *chunkResults[index])
+                if (writer is not None):
+                    writer.add(index, *chunkResults[index])
+    finally:
+        pool.cancel(jobIndexes) # when a chunk failed, the others do not keep a shared pool busy
+    return chunkResults
+
+
+def transcribePooled(filePaths, pool, metrics=None, batchSize=1):
     fullText     = ""
     fullSegments = []
-    
-    for index, itemDict in enumerate(shared_list):
-        fullText += itemDict["text"]
-        fullSegments.extend(itemDict["segments"]) #using EXTEND is the correct outcome here, **NOT** APPEND.
+    for text, segments in transcribeChunkResults(filePaths, pool, metrics=metrics, batchSize=batchSize):
+        fullText += text
+        fullSegments.extend(segments) #using EXTEND is the correct outcome here, **NOT** APPEND.
     return (fullText,fullSegments)
 
 
-def overrideMaxProcs(inputFileLen, requestedProcs):
+#    ____ BATCHED DECODING ___
+
+gFallbackTemperatures = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0) # the temperatures whisper's transcribe falls back through
+
+
+def decodeWithFallback(model, melBatch, decodeOptions):
     """
-        Whisper's sliding window is 30 seconds long.
-        Override the number of process requests if the
-        request forces the chunk size to less than 31 seconds
+        whisper.decode the 30 second windows of melBatch in one forward pass,
+        then decode again, together, only the windows whose result is too
+        repetitive or too improbable, at the next temperature.  The same rules
+        as whisper's transcribe, which does this one window at a time.
     """
-    oneSecMillis    = 1000 # 1000 milliseconds in a second
-    thirtySeconds   = 30 * oneSecMillis
-    minChunkLength  = 31.0
-    chunkSeconds    = ((inputFileLen / requestedProcs) / oneSecMillis)
-    targetProcCount = max( int(inputFileLen / thirtySeconds), 1) # if input < 30 secs, leave it alone
-    newChunkSecons  = ((inputFileLen / targetProcCount) / oneSecMillis)
-    if (chunkSeconds < minChunkLength):
-        print("Audio length is %s " %(inputFileLen / oneSecMillis))
-        print("Chunks should be greater than 30.0 seconds.")
-        print("The [%s] requested processes would make the chunks %s seconds." %(requestedProcs, chunkSeconds))
-        print("Overriding the number of processes from [%s] to [%s], with a chunk size of %s seconds.\n" %(requestedProcs, targetProcCount, newChunkSecons))
-    else:
-        targetProcCount = requestedProcs
-    return targetProcCount
+    import whisper
+    results = [None] * len(melBatch)
+    pending = list(range(len(melBatch)))
+    for temperature in gFallbackTemperatures:
+        decoded = whisper.decode(model, melBatch[pending], whisper.DecodingOptions(temperature=temperature, **decodeOptions))
+        retry   = []
+        for index, result in zip(pending, decoded):
+            results[index] = result
+            silence        = (result.no_speech_prob > 0.6 and result.avg_logprob < -1.0)
+            if (not silence and (result.compression_ratio > 2.4 or result.avg_logprob < -1.0)):
+                retry.append(index)
+        pending = retry
+        if (not pending):
+            break
+    return results
+
+
+def windowSegments(result, seek, windowFrames, tokenizer, inputStride, timePrecision):
+    """
+        Cut the tokens of one decoded window into segments at its timestamp
+        tokens, as whisper's transcribe does, and return them with the number
+        of mel frames to advance: to the last complete segment, or the whole
+        window when it ended on a single timestamp (no more speech).
+    """
+    timeOffset = seek * timePrecision / inputStride
+    tokens     = numpy.array(result.tokens, dtype=numpy.int64)
+    isStamp    = (tokens >= tokenizer.timestamp_begin)
+
+    def segment(start, end, segmentTokens):
+        return {"seek": seek, "start": start, "end": end, "text": tokenizer.decode([token for token in segmentTokens if token < tokenizer.eot]),
+                "tokens": segmentTokens, "temperature": result.temperature, "avg_logprob": result.avg_logprob,
+                "compression_ratio": result.compression_ratio, "no_speech_prob": result.no_speech_prob}
+
+    if (result.no_speech_prob > 0.6 and result.avg_logprob < -1.0):
+        return [], windowFrames # silence, skip the window
+    singleEnding = (isStamp[-2:].tolist() == [False, True])
+    consecutive  = (numpy.flatnonzero(isStamp[:-1] & isStamp[1:]) + 1).tolist()
+    if (not consecutive):
+        duration = windowFrames * timePrecision / inputStride
+        stamps   = tokens[isStamp]
+        if (len(stamps) > 0 and stamps[-1] != tokenizer.timestamp_begin):
+            duration = int(stamps[-1] - tokenizer.timestamp_begin) * timePrecision
+        return [segment(timeOffset, timeOffset + duration, tokens.tolist())], windowFrames
+    if singleEnding:
+        consecutive.append(len(tokens))
+    segments  = []
+    lastSlice = 0
+    for currentSlice in consecutive:
+        sliced    = tokens[lastSlice:currentSlice]
+        segments.append(segment(timeOffset + int(sliced[0] - tokenizer.timestamp_begin) * timePrecision,
+                                timeOffset + int(sliced[-1] - tokenizer.timestamp_begin) * timePrecision, sliced.tolist()))
+        lastSlice = currentSlice
+    if singleEnding:
+        return segments, windowFrames
+    advance = int(tokens[lastSlice - 1] - tokenizer.timestamp_begin) * inputStride # to the end of the last complete segment
+    return segments, (advance if advance > 0 else windowFrames)
+
+
+def transcribeBatched(audios, batchSize=None):
+    # Transcribe several inputs (16 kHz float32 samples) together, see transcribeFeatures
+    nMels = gWhisperModel.dims.n_mels
+    return transcribeFeatures([logMelFeatures(audio, nMels) for audio in audios], batchSize)
+
+
+def transcribeFeatures(mels, batchSize=None, wordTimestamps=False):
+    """
+        Transcribe several inputs, given as log-mel frames (see logMelFeatures),
+        with the model of this process, batchSize of them per forward pass.
+
+        Each input is read in 30 second windows, as whisper's transcribe does.
+        The next window of every input is stacked into one mel batch, so the
+        encoder runs once for all of them and the decoder loops for them
+        together (whisper.decode stops each item at its own end of text).
+        Each input then seeks to the end of its own last complete segment.
+        Unlike transcribe the previous window's text is not used as a prompt
+        (each item of a batch would need its own).  With wordTimestamps the
+        words of each window are aligned, as transcribe(word_timestamps=True) does.
+    """
+    import torch, whisper
+    from whisper.audio import N_FRAMES
+    from whisper.timing import add_word_timestamps
+    model         = gWhisperModel
+    tokenizer     = whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages, task="transcribe")
+    decodeOptions = {"language": None if model.is_multilingual else "en", "fp16": gTranscribeOptions.get("fp16", False)}
+    inputStride   = N_FRAMES // model.dims.n_audio_ctx     # mel frames per output token: 2
+    timePrecision = inputStride * gHopLength / gSampleRate # seconds per output token: 0.02
+    mels          = [torch.as_tensor(mel) for mel in mels]
+    frames        = [mel.shape[-1] for mel in mels]
+    seeks         = [0] * len(mels)
+    segments      = [[] for _ in mels]
+    lastSpeech    = [0.0] * len(mels) # end of the last word of each input
+    batchSize     = batchSize or len(mels)
+
+    while True:
+        active = [index for index in range(len(mels)) if seeks[index] < frames[index]][:batchSize]
+        if (not active):
+            break
+        sizes    = [min(N_FRAMES, frames[index] - seeks[index]) for index in active]
+        melBatch = torch.stack([whisper.pad_or_trim(mels[index][:, seeks[index] : seeks[index] + size], N_FRAMES) for index, size in zip(active, sizes)])
+        with torch.no_grad():
+            results = decodeWithFallback(model, melBatch.to(model.device), decodeOptions)
+        for item, (index, size, result) in enumerate(zip(active, sizes, results)):
+            newSegments, advance = windowSegments(result, seeks[index], size, tokenizer, inputStride, timePrecision)
+            if (wordTimestamps and newSegments):
+                with torch.no_grad():
+                    add_word_timestamps(segments=newSegments, model=model, tokenizer=tokenizer, mel=melBatch[item].to(model.device),
+                                        num_frames=size, last_speech_timestamp=lastSpeech[index])
+                words = [word for newSegment in newSegments for word in newSegment.get("words", [])]
+                if words:
+                    lastSpeech[index] = words[-1]["end"]
+            segments[index].extend(newSegment for newSegment in newSegments if newSegment["end"] > newSegment["start"] and newSegment["text"].strip())
+            seeks[index] += advance
+
+    transcripts = []
+    for inputSegments in segments:
+        for segmentId, segment in enumerate(inputSegments):
+            segment["id"] = segmentId
+        transcripts.append({"text": "".join(segment["text"] for segment in inputSegments), "segments": inputSegments})
+    return transcripts
+
+
+def sourceSamples(source):
+    # The samples of a chunk, a SharedChunk (copied out of shared memory) or a file
+    if isinstance(source, SharedChunk):
+        sharedAudio = SharedAudioBuffer(source.sampleCount, source.name)
+        try:
+            return numpy.array(sharedAudio.samples[source.start:source.end])
+        finally:
+            sharedAudio.close()
+    return decodeAudio(source)
+
+
+def sourceFeatures(source):
+    # The log-mel frames of a chunk, read from the FeatureCache or computed from its samples
+    if isinstance(source, FeatureChunk):
+        return featureChunkFrames(source)
+    return logMelFeatures(sourceSamples(source), gWhisperModel.dims.n_mels)
+
+
+def transcribeSources(sources, batched=False, wordTimestamps=False):
+    """
+        One pool job for several chunks: decoded together by transcribeFeatures
+        when batched, otherwise one after another by transcribeSource.
+        Returns one transcribeSource style result for each source.
+    """
+    if (not batched):
+        return [transcribeSource(source, wordTimestamps) for source in sources]
+    start    = timer()
+    results  = transcribeFeatures([sourceFeatures(source) for source in sources], wordTimestamps=wordTimestamps)
+    seconds  = (timer() - start)
+    labels   = [source.label if isinstance(source, (SharedChunk, FeatureChunk)) else os.path.split(source)[1] for source in sources]
+    print("Completed:        %s in %s seconds (batch of %s)" %(", ".join(labels), "{:0>3.3f}".format(seconds), len(sources))) # for testing purposes
+    finished = time.time()
+    return [{"text": result["text"], "segments": packSegments(result["segments"]),
+             "pid": os.getpid(), "seconds": seconds / len(sources), "finished": finished} for result in results]
+
+
+#    ____ TRANSCRIPTION CACHE ___
+
+class TranscriptCache:
+    """
+        An on-disk cache of chunk results (text and segments), so media that is
+        submitted again (re-uploads, re-encoded copies with the same audio) or a
+        run repeated after a crash only transcribes the chunks it has not seen.
+
+        Entries are keyed by a hash of the chunk's decoded PCM, the model name,
+        the decode options and the Whisper version, so any change of those is a
+        miss rather than a wrong answer.  The chunk's audio depends on where the
+        chunks are cut, so only runs with the same unitSeconds, overlapSeconds
+        and splitOnSilence find each other's entries; transcribeChunks uses a
+        fixed unit size (gCacheUnitSeconds) with a cache unless one is given,
+        so the process count does not change the chunks.
+
+        When the cache grows past maxBytes the least recently used entries are
+        removed.  The size of the cache is counted once, then kept up to date
+        as entries are added, and the directory is only scanned again when the
+        count goes past maxBytes.
+    """
+
+    def __init__(self, directory, maxBytes=2 * 1024**3):
+        self.directory  = Path(directory)
+        self.maxBytes   = maxBytes
+        self.totalBytes = None # counted on the first put
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, pcm, modelName, options=None):
+        # pcm is anything with the buffer protocol, e.g. a numpy view of the samples, no copy is made
+        import whisper
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps([modelName, options or {}, whisper.__version__], sort_keys=True).encode("utf-8"))
+        digest.update(memoryview(numpy.ascontiguousarray(pcm)).cast("B"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / (key + ".json")
+
+    def get(self, key):
+        # The cached {"text", "segments"}, or None
+        entryPath = self.path(key)
+        try:
+            with open(entryPath, encoding="utf-8") as entryFile:
+                entry = json.load(entryFile)
+            os.utime(entryPath) # most recently used
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, text, segments):
+        entryPath = self.path(key)
+        tempPath  = entryPath.with_suffix(".tmp%s" %(os.getpid()))
+        with open(tempPath, "w", encoding="utf-8") as entryFile:
+            json.dump({"text": text, "segments": segments}, entryFile)
+        try:
+            replacedBytes = entryPath.stat().st_size
+        except OSError:
+            replacedBytes = 0
+        addedBytes = tempPath.stat().st_size
+        os.replace(tempPath, entryPath) # never leave a half written entry behind
+        if (self.totalBytes is None):
+            self.totalBytes = self.evict()
+        else:
+            self.totalBytes += (addedBytes - replacedBytes)
+            if (self.totalBytes > self.maxBytes):
+                self.totalBytes = self.evict() # recounted, other processes may have added or removed entries
+
+    def evict(self):
+        # Remove the least recently used entries until the cache fits in maxBytes, returns its size
+        return evictLeastRecentlyUsed(self.directory, "*.json", self.maxBytes)
 
 
-def transcribeChunks(modelName, filePath, tempDirectory, maxProcesses):
+def evictLeastRecentlyUsed(directory, pattern, maxBytes, keep=None):
     """
-        Create chunked copies of the original audio files that are equal to
-        the number of forked processes we will generate.  The number of
-        forks will be no more than the number of CPUs/Cores on the machine.
-        Each process will transcribe a chunk in parallel, then concatenate
-        each of the results
+        Remove the least recently used (oldest modified) files matching pattern
+        in directory until they fit in maxBytes, never "keep" nor a file that
+        is still being written (".tmp" in its name).  Returns the size left.
     """
+    entries = []
+    for entryPath in Path(directory).glob(pattern):
+        try:
+            entryStat = entryPath.stat()
+            entries.append((entryStat.st_mtime, entryStat.st_size, entryPath))
+        except OSError:
+            pass # removed by another process
+    totalBytes = sum(size for _, size, _ in entries)
+    for _, size, entryPath in sorted(entries):
+        if (totalBytes <= maxBytes):
+            break
+        if (entryPath == keep or ".tmp" in entryPath.name):
+            continue # in use by this run, or being written by another
+        try:
+            entryPath.unlink() # a worker that still maps it keeps reading it
+        except OSError:
+            pass
+        totalBytes -= size
+    return totalBytes
+
+
+def digestFile(digest, filePath):
+    # Add the contents of a file to a hashlib digest, a block at a time
+    with open(filePath, "rb") as inFile:
+        for block in iter(lambda: inFile.read(1024**2), b""):
+            digest.update(block)
+    return digest
+
+
+#    ____ LOG-MEL FEATURES ___
+
+"""
+    A range of frames of a FeatureCache entry, the log-mel counterpart of a SharedChunk
+"""
+FeatureChunk = namedtuple("FeatureChunk", ["path", "start", "end", "label"])
+
+gHopLength = 160 # samples per log-mel frame (whisper.audio.HOP_LENGTH), 100 frames per second
+
+
+def logMelFeatures(samples, nMels, outArray=None, blockFrames=60000):
+    """
+        Whisper's log-mel spectrogram of a whole input, one frame per 160
+        samples, the same values whisper's transcribe computes for the file.
+
+        The STFT runs on blocks of blockFrames frames (10 minutes), each padded
+        on its own as torch.stft pads the whole input, and the frames are
+        written into outArray (e.g. a memory-mapped .npy) when one is given.
+        Beyond the samples themselves (about 230 MB an hour) and the features,
+        the working memory is one block, whatever the length of the input.
+        The dynamic range is clamped over the whole input, as whisper does.
+    """
+    import torch
+    from whisper.audio import N_FFT, mel_filters
+    frameCount = len(samples) // gHopLength
+    melArray   = outArray if (outArray is not None) else numpy.empty((nMels, frameCount), dtype=numpy.float32)
+    padding    = N_FFT // 2
+    window     = torch.hann_window(N_FFT)
+    filters    = mel_filters("cpu", nMels)
+    for first in range(0, frameCount, blockFrames):
+        last      = min(first + blockFrames, frameCount)
+        block     = torch.from_numpy(paddedSamples(samples, first * gHopLength - padding, (last - 1) * gHopLength + N_FFT - padding))
+        stft      = torch.stft(block, N_FFT, gHopLength, window=window, center=False, return_complex=True)
+        melArray[:, first:last] = torch.clamp(filters @ stft.abs() ** 2, min=1e-10).log10().numpy()
+    if (frameCount > 0):
+        floor = melArray.max() - 8.0
+        for first in range(0, frameCount, blockFrames):
+            block = melArray[:, first : first + blockFrames]
+            numpy.maximum(block, floor, out=block)
+            block += 4.0
+            block /= 4.0
+    return melArray
+
+
+def paddedSamples(samples, start, end):
+    # samples[start:end] as float32, reflected before the first sample (like torch.stft) and zeros after the last
+    block = numpy.zeros(end - start, dtype=numpy.float32)
+    inner = (max(start, 0), min(end, len(samples)))
+    if (inner[1] > inner[0]):
+        block[inner[0] - start : inner[1] - start] = samples[inner[0] : inner[1]]
+    if (start < 0):
+        reflected = samples[1 : 1 - start][::-1]
+        block[-start - len(reflected) : -start] = reflected
+    return block
+
+
+class FeatureCache:
+    """
+        Log-mel features of whole inputs, computed once by the parent (the
+        producer) before the workers start, and kept as memory-mapped .npy
+        files the workers read their chunks from (see FeatureChunk).  Workers
+        no longer decode and compute the spectrogram themselves, so that work
+        does not compete with inference, and the page cache holds one copy
+        of the features for all of them.
+
+        Entries are keyed by a hash of the input file, the number of mel bins
+        and the Whisper version, so the features of a file are reused by every
+        model with the same number of mel bins (every model but large-v3).
+        When the cache grows past maxBytes the least recently used entries
+        are removed.
+    """
+
+    def __init__(self, directory, maxBytes=8 * 1024**3):
+        self.directory = Path(directory)
+        self.maxBytes  = maxBytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, filePath, nMels):
+        import whisper
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps([nMels, gSampleRate, whisper.__version__]).encode("utf-8"))
+        return digestFile(digest, filePath).hexdigest()
+
+    def path(self, key):
+        return self.directory / (key + ".npy")
+
+    def build(self, filePath, nMels):
+        # The path of the features of filePath, computed unless they are in the cache
+        entryPath = self.path(self.key(filePath, nMels))
+        if entryPath.exists():
+            os.utime(entryPath) # most recently used
+            return entryPath
+        samples  = decodeAudio(filePath)
+        tempPath = entryPath.with_suffix(".tmp%s.npy" %(os.getpid()))
+        melArray = numpy.lib.format.open_memmap(tempPath, mode="w+", dtype=numpy.float32, shape=(nMels, len(samples) // gHopLength))
+        logMelFeatures(samples, nMels, melArray)
+        melArray.flush()
+        del melArray
+        os.replace(tempPath, entryPath) # never leave half written features behind
+        self.evict(keep=entryPath)
+        return entryPath
+
+    def load(self, entryPath):
+        # The features, memory mapped (read only), nothing is read until it is used
+        return numpy.load(entryPath, mmap_mode="r")
+
+    def evict(self, keep=None):
+        return evictLeastRecentlyUsed(self.directory, "*.npy", self.maxBytes, keep)
+
+
+def featureChunkFrames(chunk):
+    # The frames of a FeatureChunk, copied out of the memory-mapped features
+    return numpy.array(numpy.load(chunk.path, mmap_mode="r")[:, chunk.start:chunk.end])
+
+
+#    ____ JOB JOURNAL ___
+
+class JobJournal:
+    """
+        Durable checkpoints of long jobs, so a run that dies (a crash, Ctrl-C,
+        a preempted spot instance) resumes where it stopped instead of
+        starting over.
+
+        Each job (an input, model, decode options and chunking parameters) gets
+        its own directory under "directory" with a manifest and one checkpoint
+        per chunk, written (and synced) as soon as that chunk completes.  The
+        manifest also keeps the job's chunk plan, so running the same job again
+        (even with another number of processes, which changes the default unit
+        size) reuses the chunks of the interrupted run, only schedules the ones
+        without a checkpoint, and the SRT, JSON and TXT are assembled from the
+        checkpoints.  A finished job's directory is removed, unless keepFinished.
+    """
+
+    def __init__(self, directory, keepFinished=False):
+        self.directory    = Path(directory)
+        self.keepFinished = keepFinished
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def begin(self, filePath, modelName, options, chunking):
+        # The checkpoints of this job, created or, after a restart, found again
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps([modelName, options or {}, chunking], sort_keys=True).encode("utf-8"))
+        digestFile(digest, filePath)
+        return JobCheckpoints(self.directory / digest.hexdigest(), {"file": str(filePath), "model": modelName, "options": options,
+                              "chunking": chunking, "created": time.time()}, self.keepFinished)
+
+
+class JobCheckpoints:
+    # One job's directory of a JobJournal: manifest.json and chunk0001.json, chunk0002.json, ... 
+
+    def __init__(self, directory, manifest, keepFinished=False):
+        self.directory    = Path(directory)
+        self.keepFinished = keepFinished
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if (not (self.directory / "manifest.json").exists()):
+            self.writeAtomic(self.directory / "manifest.json", manifest)
+        with open(self.directory / "manifest.json", encoding="utf-8") as manifestFile:
+            self.manifest = json.load(manifestFile)
+
+    def planned(self):
+        # True when an earlier run of this job already recorded its chunk plan
+        return ("windowOffsets" in self.manifest)
+
+    def plan(self, unitSeconds, chunkOffsets, windowOffsets):
+        # Records the chunk plan of the job's first run in the manifest
+        if (not self.planned()):
+            self.manifest.update(chunks=len(windowOffsets), unitSeconds=unitSeconds, chunkOffsets=chunkOffsets, windowOffsets=windowOffsets)
+            self.writeAtomic(self.directory / "manifest.json", self.manifest)
+
+    def path(self, index):
+        return self.directory / "chunk{:04d}.json".format(index + 1)
+
+    def writeAtomic(self, filePath, data):
+        # Written to a temporary file and synced before it replaces the checkpoint, so a checkpoint is whole or absent
+        tempPath = filePath.with_suffix(".tmp%s" %(os.getpid()))
+        with open(tempPath, "w", encoding="utf-8") as outFile:
+            json.dump(data, outFile)
+            outFile.flush()
+            os.fsync(outFile.fileno())
+        os.replace(tempPath, filePath)
+        try:
+            directoryFd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directoryFd) # the rename itself must survive a crash too
+            finally:
+                os.close(directoryFd)
+        except OSError:
+            pass # not supported everywhere (e.g. Windows)
+
+    def put(self, index, text, segments):
+        self.writeAtomic(self.path(index), {"text": text, "segments": segments})
+
+    def get(self, index):
+        # (text, segments) of a checkpointed chunk, or None
+        try:
+            with open(self.path(index), encoding="utf-8") as checkpointFile:
+                checkpoint = json.load(checkpointFile)
+            return (checkpoint["text"], checkpoint["segments"])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def completed(self):
+        # {index: (text, segments)} of the chunks whose checkpoint can be read, a damaged one is transcribed again
+        checkpoints = {index: self.get(index) for index in range(self.manifest["chunks"])}
+        return {index: checkpoint for index, checkpoint in checkpoints.items() if checkpoint is not None}
+
+    def finish(self):
+        # Called once the outputs are written
+        if self.keepFinished:
+            self.writeAtomic(self.directory / "finished.json", {"finished": time.time()})
+            return
+        for checkpointPath in self.directory.iterdir():
+            checkpointPath.unlink()
+        self.directory.rmdir()
+
+
+#    ____ OVERLAPPING CHUNKS ___
+
+def overlapChunkRanges(chunkRanges, overlap, length):
+    # Widen each (start, end) range by overlap on both sides, within 0..length
+    return [(max(chunkStart - overlap, 0), min(chunkEnd + overlap, length)) for chunkStart, chunkEnd in chunkRanges]
+
+
+def trimOverlapSegments(segments, windowStart, coreStart, coreEnd):
+    """
+        Keep the segments of one overlapped chunk that belong to its core.
+
+        The chunk was transcribed from windowStart (seconds, with context on
+        each side) but only owns coreStart..coreEnd.  Overlapped chunks are
+        transcribed with word timestamps, so each word is kept when its midpoint
+        lies in the core, and each word said in an overlap is kept by exactly
+        one chunk even when the two chunks cut their segments differently.
+        A segment without words is kept or dropped whole, by its midpoint.
+        The kept segments are returned relative to coreStart with ids from 0,
+        the same form as the segments of a chunk that was not overlapped.
+    """
+    shift = (windowStart - coreStart)
+    kept  = []
+    for segment in segments:
+        words = segment.get("words")
+        if words:
+            words = [word for word in words if coreStart <= windowStart + (word["start"] + word["end"]) / 2 < coreEnd]
+            if (not words):
+                continue
+            segment = dict(segment, text="".join(word["word"] for word in words), start=words[0]["start"], end=words[-1]["end"],
+                           words=[dict(word, start=word["start"] + shift, end=word["end"] + shift) for word in words])
+        elif (not (coreStart <= windowStart + (segment["start"] + segment["end"]) / 2 < coreEnd)):
+            continue
+        kept.append(dict(segment, id=len(kept), start=max(segment["start"] + shift, 0.0), end=segment["end"] + shift))
+    return kept
+
+
+def mergeOverlappedChunks(chunkResults, windowOffsets, chunkOffsets):
+    """
+        Merge the (text, segments) of overlapped chunks: trim each chunk to its
+        core (see trimOverlapSegments) and drop a segment at the start of a chunk
+        that repeats, word for word and at the same time, the last kept segment
+        of the previous chunk.
+    """
+    merged      = []
+    previousEnd = None # (text, end in seconds) of the last kept segment
+    for index, (_, segments) in enumerate(chunkResults):
+        segments, previousEnd = mergeOverlappedChunk(index, segments, windowOffsets, chunkOffsets, previousEnd)
+        merged.append(("".join(segment["text"] for segment in segments), segments))
+    return merged
+
+
+def mergeOverlappedChunk(index, segments, windowOffsets, chunkOffsets, previousEnd):
+    # One chunk of mergeOverlappedChunks, in order: (the kept segments, previousEnd for the next chunk)
+    coreStart, coreEnd = chunkOffsets[index]
+    if (index == len(windowOffsets) - 1):
+        coreEnd = float("inf") # the last chunk owns everything to the end
+    segments = trimOverlapSegments(segments, windowOffsets[index][0], coreStart, coreEnd)
+    if (segments and previousEnd is not None and coreStart + segments[0]["start"] < previousEnd[1]
+                 and normalizeText(segments[0]["text"]) == previousEnd[0]):
+        segments = [dict(segment, id=segment["id"] - 1) for segment in segments[1:]]
+    if segments:
+        previousEnd = (normalizeText(segments[-1]["text"]), coreStart + segments[-1]["end"])
+    return (segments, previousEnd)
+
+
+def normalizeText(text):
+    return " ".join(text.lower().replace(",", " ").replace(".", " ").split())
+
+
+def chooseUnitSeconds(inputSeconds, processCount, unitsPerWorker=4, maxUnitSeconds=600):
+    """
+        The unit-size policy: the audio is cut into many units, more than there
+        are workers, and each idle worker is sent the next unit by the pool,
+        so one slow unit (dense speech, a hallucination loop) only delays the
+        end of the run by about one unit instead of by one whole chunk.
+
+        Whisper's sliding window is 30 seconds long, so units are whole
+        multiples of 30 seconds (never less), aiming for unitsPerWorker
+        units for each worker, and no longer than maxUnitSeconds.
+    """
+    whisperWindow = 30
+    targetSeconds = inputSeconds / (max(processCount, 1) * unitsPerWorker)
+    windowCount   = max(int(round(targetSeconds / whisperWindow)), 1)
+    return min(windowCount * whisperWindow, max(maxUnitSeconds, whisperWindow))
+
+
+def unitChunkRanges(sampleCount, sampleRate, unitSeconds):
+    """
+        (start, end) indexes of consecutive units of unitSeconds.  A remainder
+        shorter than half a unit is added to the last unit instead of being
+        transcribed on its own.
+    """
+    unitSamples = max(int(unitSeconds * sampleRate), 1)
+    bounds      = list(range(0, sampleCount, unitSamples)) + [sampleCount]
+    if (len(bounds) > 2 and (bounds[-1] - bounds[-2]) < unitSamples / 2):
+        del bounds[-2]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def transcribeChunks(modelName, filePath, tempDirectory, maxProcesses, pool=None, inMemory=False, splitOnSilence=False, unitSeconds=None, overlapSeconds=0.0, cache=None, metrics=None, batchSize=1, features=None, journal=None):
+    """
+        Create chunked copies of the original audio file, cut into units of
+        unitSeconds (by default chosen by chooseUnitSeconds), several for each
+        of the forked processes we will generate.  The number of forks will be
+        no more than the number of CPUs/Cores on the machine.  Each process
+        takes the next unit as soon as it is free, and the results are
+        concatenated in the order of the units
+
+        Pass a started WhisperWorkerPool as "pool" to reuse its workers (and
+        their loaded model) across calls, otherwise a pool is created for this
+        file and shut down when it is done.
+
+        With inMemory=True the input is decoded once into 16 kHz samples in
+        shared memory and each worker transcribes its range of them, so no
+        chunk files are exported and nothing is decoded a second time.
+
+        With splitOnSilence=True the chunks are cut in the quietest point near
+        each equal-length split (see planChunkBoundaries), so words are not
+        cut in half, and the timeline is repaired with each chunk's own offset.
+
+        With overlapSeconds > 0 each chunk is transcribed with that much extra
+        audio on each side, for audio without pauses to cut in (music beds,
+        crosstalk).  The chunks are transcribed with word timestamps and the
+        overlaps are merged word by word, so each word is kept once (see
+        trimOverlapSegments).  "Overlap Overhead" reports the
+        extra audio that had to be transcribed.
+
+        With a TranscriptCache as "cache", chunks whose audio, model and
+        options were transcribed before are taken from the cache.  Unless
+        unitSeconds is given, the units are then gCacheUnitSeconds long, so
+        runs with different maxProcesses cut (and find) the same chunks.
+
+        With a RunMetrics as "metrics", every phase (decode, modelLoad,
+        chunkBuild, export, inference, per-chunk chunkInference and transfer,
+        merge, repair, write) is logged as a JSON span, and progress with an
+        ETA is reported as each chunk completes.
+
+        With batchSize > 1 each worker decodes batchSize chunks together in one
+        forward pass (see transcribeBatched), e.g. 4 processes x batchSize 4.
+
+        With a FeatureCache as "features", the log-mel features of the whole
+        input are computed once (or taken from the cache, e.g. when the same
+        file is run through several models) and each worker reads its chunk's
+        frames from the memory-mapped features instead of decoding audio.
+
+        The SRT, JSONL and TXT are written while the chunks complete, in
+        timeline order (see TranscriptWriter), and the JSON when all are done.
+
+        With a JobJournal as "journal", each chunk's result is checkpointed as
+        soon as it completes.  If the run is interrupted, running it again
+        only transcribes the chunks without a checkpoint (the chunks planned by
+        the interrupted run, whatever maxProcesses is now), and the outputs are
+        assembled from the checkpoints.
+
+        Returns the run's statistics, with the seconds spent in each phase in
+        "phases".
+    """
+    runStart          = timer()
+    metrics           = metrics or RunMetrics()
+    phasesBefore      = (dict(metrics.phaseSeconds), dict(metrics.phaseCounts)) # the metrics may be shared by several runs
     internal_maxProcs = maxProcesses
     actualCPUs        = multiprocessing.cpu_count()
     oneSecMillis      = 1000 # 1000 milliseconds in a second
@@ -385,48 +2140,155 @@ def transcribeChunks(modelName, filePath, tempDirectory, maxProcesses):
     if (overUtilized == True):
         print(request % (maxProcesses, actualCPUs))
         
-    # Consume the input file and convert it into segments
+    # Consume the input file and convert it into segments (or, in memory, into samples)
     root, fileExt      = os.path.splitext(filePath)
     fileExt            = fileExt.lstrip(".") # we dont need or want the "." for the extension
     fileDir, fileName  = os.path.split(filePath)
-    audioSegment       = AudioSegment.from_file(filePath, fileExt)
-    inFileMillisecs    = len(audioSegment) # duration of input file in milliseconds
-    oldInternMaxProcs  = internal_maxProcs
-    internal_maxProcs  = overrideMaxProcs(inFileMillisecs, internal_maxProcs) # overrides process request depending on circumstances -- can comment out to unrestrict
-    chunk_length_ms    = (inFileMillisecs / internal_maxProcs)# pydub calculates in millisec [[DO NOT TRUNCATE TO INTEGER]]
-    chunks             = make_chunks(audioSegment, chunk_length_ms) #Make chunks of the audio
-    chunkCountStr      = str(len(chunks))
-    internalFormat     = "wav" # mp3, wav (mp3 is 300x (or more) slower because of the conversion which saves space but the time tradeoff is not justified)
+    samples            = None
+    if (features is not None):
+        with metrics.span("features", file=fileName):
+            featurePath     = features.build(filePath, getWhisperModel(modelName).dims.n_mels) # computed once, reused by every run and model
+            featureFrames   = features.load(featurePath).shape[-1]
+            inFileMillisecs = (featureFrames * gHopLength * oneSecMillis / gSampleRate)
+    with metrics.span("decode", file=fileName):
+        if (splitOnSilence or (inMemory and features is None)):
+            samples         = decodeAudio(filePath) # decoded once, the workers read views of it
+            inFileMillisecs = (len(samples) * oneSecMillis / gSampleRate)
+        if (not inMemory and features is None):
+            audioSegment    = AudioSegment.from_file(filePath, fileExt)
+            inFileMillisecs = len(audioSegment) # duration of input file in milliseconds
     file_seconds       = (inFileMillisecs / oneSecMillis)
-    chunk_seconds      = (len(chunks[0]) / oneSecMillis)
+    chunking           = {"unitSeconds": unitSeconds, "overlapSeconds": overlapSeconds, "splitOnSilence": splitOnSilence} # as requested, before the defaults
+    if (unitSeconds is None and cache is not None):
+        unitSeconds    = gCacheUnitSeconds # the same chunks (and cache keys) whatever the number of processes
+    elif (unitSeconds is None):
+        unitSeconds    = chooseUnitSeconds(file_seconds, internal_maxProcs)
+    if (inMemory or splitOnSilence or features is not None):
+        rangeRate      = gSampleRate # chunk ranges are in samples
+        rangeLength    = len(samples) if (samples is not None) else (featureFrames * gHopLength)
+    else:
+        rangeRate      = oneSecMillis # chunk ranges are in milliseconds of the AudioSegment
+        rangeLength    = len(audioSegment)
+    unitCount          = len(unitChunkRanges(rangeLength, rangeRate, unitSeconds))
+    internal_maxProcs  = min(internal_maxProcs, unitCount) # no point in more workers than units
+    internalFormat     = "wav" # mp3, wav (mp3 is 300x (or more) slower because of the conversion which saves space but the time tradeoff is not justified)
     tempFileArray      = []
+    chunkSources       = [] # file paths, SharedChunks when inMemory, or FeatureChunks
+    cacheKeys          = [] # TranscriptCache key of each chunk
+    known              = None # results of the chunks found in the cache or checkpoints, once looked up
+    sharedAudio        = None
+    checkpoints        = None
+    checkpointed       = None # {index: (text, segments)} of the chunks with a readable checkpoint
+    writer             = None
+    wordTimestamps     = (overlapSeconds > 0) # the overlaps are merged word by word
+    cacheOptions       = dict(transcribeOptions(wordTimestamps), batched=True) if (batchSize > 1 or features is not None) else transcribeOptions(wordTimestamps) # batched results differ slightly
     
-    # Write the chunks to disk as temporary files for processing
-    print('starting')
-    start = timer()
-    for index, chunk in enumerate(chunks):
-        chunk_name = "chunk{:03d}.".format(index + 1) + internalFormat
-        display    = "Exporting:        {:03d} of ".format(index + 1) + chunkCountStr + " -> "
-        tempFile   = tempDirectory + chunk_name
-        print (display, chunk_name)
-        chunk.export(tempFile, format=internalFormat)
-        tempFileArray.append(tempFile)
-    end = timer()
-    
-    print("*---------------")
-    print("Target File Time: %s seconds," %(file_seconds), "H:M:S %s" %(formatTime(file_seconds)))
-    print("Chunk Seconds:    %s" %(chunk_seconds))
-    print("Processes Used:   %s" %(internal_maxProcs), "(for %s chunks)" %(chunkCountStr))
-    print("Built in CPUs:    %s" %(actualCPUs))
-    print("Chunk Build Time: %s" %(end - start))
-    print("*---------------")
-
-    start    = timer()
-    allText  , allSegments = transcribeParallel(tempFileArray)
-    end      = timer()
+    ownsPool = (pool is None)
+    if ownsPool:
+        with metrics.span("modelLoad", model=modelName, processes=internal_maxProcs):
+            pool = WhisperWorkerPool(modelName, internal_maxProcs).start() # workers for this file only
+    internal_maxProcs = min(internal_maxProcs, pool.processCount)
+
+    try:
+        print('starting')
+        start      = timer()
+        buildStart = timer()
+        if (journal is not None):
+            checkpoints   = journal.begin(filePath, modelName, cacheOptions, chunking)
+        if (checkpoints is not None and checkpoints.planned()):
+            # Resumed, the chunks of the interrupted run whatever the number of processes is now
+            unitSeconds   = checkpoints.manifest["unitSeconds"]
+            chunkRanges   = [(round(chunkStart * rangeRate), round(chunkEnd * rangeRate)) for chunkStart, chunkEnd in checkpoints.manifest["chunkOffsets"]]
+            windowRanges  = [(round(windowStart * rangeRate), round(windowEnd * rangeRate)) for windowStart, windowEnd in checkpoints.manifest["windowOffsets"]]
+        else:
+            if splitOnSilence:
+                chunkRanges = planChunkBoundaries(samples, unitCount)
+            else:
+                chunkRanges = unitChunkRanges(rangeLength, rangeRate, unitSeconds)
+            windowRanges  = overlapChunkRanges(chunkRanges, int(overlapSeconds * rangeRate), rangeLength) # what is transcribed
+        chunkOffsets  = [(chunkStart / rangeRate, chunkEnd / rangeRate) for chunkStart, chunkEnd in chunkRanges]
+        chunk_seconds = (chunkOffsets[0][1] - chunkOffsets[0][0])
+        windowOffsets = [(windowStart / rangeRate, windowEnd / rangeRate) for windowStart, windowEnd in windowRanges]
+        overheadPct   = 100.0 * (sum(windowEnd - windowStart for windowStart, windowEnd in windowOffsets) - file_seconds) / max(file_seconds, 1e-9)
+        if (checkpoints is not None):
+            checkpoints.plan(unitSeconds, chunkOffsets, windowOffsets)
+            checkpointed  = checkpoints.completed()
+        if (features is not None):
+            # Each chunk is only a range of frames of the memory-mapped features
+            chunkSources  = [FeatureChunk(str(featurePath), windowStart // gHopLength, windowEnd // gHopLength, "chunk{:03d}".format(index + 1))
+                             for index, (windowStart, windowEnd) in enumerate(windowRanges)]
+            if (cache is not None):
+                melArray  = features.load(featurePath)
+                cacheKeys = [cache.key(melArray[:, chunk.start:chunk.end], modelName, cacheOptions) for chunk in chunkSources]
+            samples = None
+        elif inMemory:
+            # Place the samples in shared memory, each chunk is only a range of it
+            sharedAudio   = SharedAudioBuffer.fromSamples(samples)
+            chunkSources  = [sharedAudio.chunk(windowStart, windowEnd, "chunk{:03d}".format(index + 1)) for index, (windowStart, windowEnd) in enumerate(windowRanges)]
+            if (cache is not None):
+                cacheKeys = [cache.key(sharedAudio.samples[windowStart:windowEnd], modelName, cacheOptions) for windowStart, windowEnd in windowRanges]
+            del samples
+        else:
+            # Write the chunks to disk as temporary files for processing
+            chunks        = [audioSegment[windowStart * oneSecMillis : windowEnd * oneSecMillis] for windowStart, windowEnd in windowOffsets]
+            chunkCountStr = str(len(chunks))
+            if (cache is not None):
+                cacheKeys = [cache.key(chunk.raw_data, modelName, cacheOptions) for chunk in chunks]
+            known         = knownChunkResults(len(chunks), cache, cacheKeys, checkpointed) # read once, what is exported is exactly what is not known
+            metrics.record("chunkBuild", timer() - buildStart, chunks=len(chunks))
+            for index, chunk in enumerate(chunks):
+                if (known[index] is not None):
+                    chunkSources.append(None) # already transcribed, no need to export it
+                    continue
+                chunk_name = "chunk{:03d}.".format(index + 1) + internalFormat
+                display    = "Exporting:        {:03d} of ".format(index + 1) + chunkCountStr + " -> "
+                tempFile   = tempDirectory + chunk_name
+                print (display, chunk_name)
+                with metrics.span("export", chunk=index):
+                    chunk.export(tempFile, format=internalFormat)
+                tempFileArray.append(tempFile)
+                chunkSources.append(tempFile)
+        if (inMemory or features is not None):
+            known = knownChunkResults(len(chunkSources), cache, cacheKeys, checkpointed)
+            metrics.record("chunkBuild", timer() - buildStart, chunks=len(chunkSources))
+        end = timer()
+        
+        print("*---------------")
+        print("Target File Time: %s seconds," %(file_seconds), "H:M:S %s" %(formatTime(file_seconds)))
+        print("Chunk Seconds:    %s" %(chunk_seconds), "(unit size %s seconds)" %(unitSeconds))
+        print("Processes Used:   %s" %(internal_maxProcs), "(for %s chunks)" %(len(chunkSources)))
+        print("Worker Tuning:    %s" %(describeTuning(pool.tuning)))
+        print("Built in CPUs:    %s" %(actualCPUs))
+        if (batchSize > 1):
+            print("Batch Size:       %s chunks per forward pass" %(batchSize))
+        if (features is not None):
+            print("Features:         %s (%s frames, read by the workers)" %(featurePath, featureFrames))
+        print("Chunk Build Time: %s" %(end - start))
+        if (overlapSeconds > 0):
+            print("Overlap Overhead: %.1f%%" %(overheadPct), "(%s seconds on each side of each chunk)" %(overlapSeconds))
+        if (checkpoints is not None):
+            print("Checkpoints:      %s of %s chunks already done (%s)" %(len(checkpointed), len(chunkSources), checkpoints.directory))
+        print("*---------------")
+
+        start        = timer()
+        writer       = TranscriptWriter(tempDirectory, Path(filePath).stem, chunkOffsets, windowOffsets if (overlapSeconds > 0) else None, metrics)
+        with metrics.span("inference", chunks=len(chunkSources), processes=internal_maxProcs):
+            transcribeChunkResults(chunkSources, pool, cache, cacheKeys, metrics, batchSize, checkpoints, writer, wordTimestamps, known) # merged and written as they complete
+        metrics.recordWorkerMemory(pool.workerMemory()) # before the workers of our own pool are shut down
+        writer.close()
+        allText      = writer.text
+        allSegments  = writer.segments
+        end          = timer()
+    finally:
+        if (writer is not None):
+            writer.close() # what was written so far stays valid
+        if ownsPool:
+            pool.shutdown()
+        if (sharedAudio is not None):
+            sharedAudio.unlink()
+        removeTempFiles(tempFileArray)
     elapsed  = (end - start)
     convRate = file_seconds / elapsed
-    finalStr = allText.encode('utf-8')      # Resolve Python exception: 'ascii' codec can't encode character '\ufffd' in position 2122:
     elapsStr = "{:0>3.3f}".format(elapsed)  # leading zeroes, three decimal places
     cpusStr  = "{:03d} on ".format(internal_maxProcs) + str(actualCPUs) + "CPUs" # leading zeroes
     convStr  = "{:0>3.3f}".format(convRate) # leading zeroes, three decimal places
@@ -434,42 +2296,641 @@ def transcribeChunks(modelName, filePath, tempDirectory, maxProcesses):
     print("*---------------")
     actionStr = "!--[Transcribe]   TargetDuration: %s seconds - %s(H:M:S), ChunksProcessd: %s, Model: %s, Completed: %s seconds - %s(H:M:S), Speed: %sx"
     print(actionStr %(file_seconds,formatTime(file_seconds), cpusStr, modelName, elapsStr, formatTime(elapsed), convStr))
+    utilization = metrics.workerUtilization()
+    if utilization:
+        print("Worker Busy:      %s" %(", ".join("%s %.0f%%" %(pid, 100 * busy) for pid, busy in sorted(utilization.items()))))
+    workerMemory = {kind: max(memory[kind] for memory in metrics.workerMemory.values()) for kind in ("rss", "pss", "shared", "private")} if metrics.workerMemory else {}
+    if workerMemory:
+        print("Worker Memory:    RSS %.0f MB, PSS %.0f MB, shared %.0f MB, private %.0f MB (largest worker, %s)" %(
+            workerMemory["rss"] / 1024**2, workerMemory["pss"] / 1024**2, workerMemory["shared"] / 1024**2, workerMemory["private"] / 1024**2,
+            "weights shared" if pool.tuning.sharedWeights else "weights copied on write"))
+    if (writer.firstCaption is not None):
+        print("First Caption:    %.3f seconds (%.3f for the whole file)" %(writer.firstCaption, elapsed))
     print("\n")
     
-    # alternate methods for writing the text or segments to disk
-    writeTestfile(filePath, tempDirectory, allSegments, chunk_seconds) # write, TEXT, SRT and JSON to disk using segments
-    writeTextFile(filePath, tempDirectory, finalStr) # take the final string returned and write it to disk
+    # the SRT, JSONL, TXT and JSON were written by the TranscriptWriter
+    if (checkpoints is not None):
+        checkpoints.finish() # the outputs are written, the job is done
     
-    removeTempFiles(tempFileArray)
-    print(finalStr)
+    print(allText.encode('utf-8')) # Resolve Python exception: 'ascii' codec can't encode character '\ufffd' in position 2122:
+    phaseTimes = {name: seconds - phasesBefore[0].get(name, 0.0) for name, seconds in metrics.phaseSeconds.items()
+                  if (metrics.phaseCounts[name] > phasesBefore[1].get(name, 0))}
+    stats      = {"model": modelName, "fileSeconds": file_seconds, "elapsed": elapsed, "wallSeconds": (timer() - runStart),
+                  "processes": internal_maxProcs, "chunks": len(chunkSources), "unitSeconds": unitSeconds,
+                  "overlapOverheadPct": overheadPct, "batchSize": batchSize, "segments": len(allSegments), "phases": phaseTimes, "workerMemory": workerMemory,
+                  "firstCaptionSeconds": writer.firstCaption}
+    metrics.emit(dict({"event": "run", "file": fileName}, **stats))
+    return stats
+
+
+#    ____ STREAMING INPUT ___
+
+def streamAudioWindows(filePath, windowSamples, inputArgs=(), decoders=None):
+    """
+        Decode the input through an ffmpeg pipe and yield it in windows of
+        windowSamples 16 kHz int16 samples (the last window may be shorter).
+        Only one window is held here at a time, whatever the length of the input.
+        The ffmpeg process is added to "decoders", if given, so another thread
+        can stop it while a read is waiting for the input.
+    """
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", *inputArgs, "-i", filePath,
+               "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(gSampleRate), "-"]
+    decoder = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if (decoders is not None):
+        decoders.append(decoder)
+    try:
+        while True:
+            data = decoder.stdout.read(windowSamples * 2) # blocks until the window is full or the input ends
+            if (not data):
+                break
+            yield numpy.frombuffer(data[:len(data) - (len(data) % 2)], numpy.int16)
+        if (decoder.wait() != 0):
+            raise RuntimeError("ffmpeg could not decode %s: %s" %(filePath, decoder.stderr.read().decode(errors="replace").strip()))
+    finally:
+        if (decoder.poll() is None):
+            decoder.kill()
+            decoder.wait()
+        decoder.stdout.close()
+        decoder.stderr.close()
+
+
+def transcribeStream(modelName, filePath, tempDirectory, maxProcesses, pool=None, windowSeconds=300, maxInFlight=None, inputArgs=(),
+                     outputName=None, live=False, metrics=None, onSegments=None):
+    """
+        Transcribe a long input without loading it into memory.
+
+        The input is decoded through an ffmpeg pipe in windows of windowSeconds,
+        and each window is handed to a worker as soon as it has been read.
+        Windows are placed in a ring of maxInFlight shared memory slots
+        (default: two per worker), so peak memory is
+        maxInFlight * windowSeconds * 16000 * 4 bytes, not the length of the file.
+        When every slot is busy, reading waits for a worker to finish a window.
+        The SRT, JSONL and TXT grow as the windows complete (see TranscriptWriter),
+        and "onSegments" is called with the segments of each window as they are written.
+
+        With live=True (see transcribeLive) the latency of each window (from its
+        last sample arriving to its captions being written) and the lag behind
+        the wall clock are reported, to size the workers for real time.
+    """
+    windowSamples = int(windowSeconds * gSampleRate)
+    metrics       = metrics or RunMetrics()
+    outputName    = outputName or Path(filePath).stem
+    ownsPool      = (pool is None)
+    if ownsPool:
+        pool = WhisperWorkerPool(modelName, maxProcesses).start() # workers for this file only
+    if (maxInFlight is None):
+        maxInFlight = 2 * pool.processCount # one being transcribed and one waiting, for each worker
+    maxInFlight   = max(maxInFlight, 1)
+    slotBuffer    = SharedAudioBuffer(maxInFlight * windowSamples)
+    freeSlots     = list(range(maxInFlight))
+    inFlight      = {} # jobId -> (windowIndex, slot, (start, end) seconds of the window)
+    arrived       = {} # windowIndex -> (time its last sample was read, end in seconds of the window)
+    latencies     = []
+    writer        = TranscriptWriter(tempDirectory, outputName, metrics=metrics)
+    totalSamples  = 0
+    decoders      = [] # the ffmpeg process, so it can be stopped while the reader is waiting for it
+    windowQueue   = queue.Queue(maxsize=1) # windows read ahead, waiting for a free slot
+    stopReading   = threading.Event()
+
+    def readWindows():
+        # Read on our own thread, so results are written while the next window is still arriving
+        try:
+            for window in streamAudioWindows(filePath, windowSamples, inputArgs, decoders):
+                item = (window, timer())
+                while (not stopReading.is_set()):
+                    try:
+                        windowQueue.put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        pass
+            item = None # the input has ended
+        except Exception as error:
+            item = error
+        while (not stopReading.is_set()):
+            try:
+                windowQueue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                pass
+
+    print("*---------------")
+    print("Streaming:        %s" %(filePath))
+    print("Window Seconds:   %s" %(windowSeconds))
+    print("Processes Used:   %s" %(pool.processCount))
+    print("Worker Tuning:    %s" %(describeTuning(pool.tuning)))
+    print("In Flight:        %s windows (%s MB of samples)" %(maxInFlight, (maxInFlight * windowSamples * 4) // (1024 * 1024)))
+    print("*---------------")
+
+    def collectWindows(timeout):
+        for jobId, result in pool.poll(list(inFlight), timeout):
+            windowIndex, slot, windowRange = inFlight.pop(jobId)
+            written = (writer.nextIndex, len(writer.segments))
+            writer.add(windowIndex, result["text"], unpackSegments(result["segments"]), windowRange)
+            freeSlots.append(slot)
+            now = timer()
+            for index in range(written[0], writer.nextIndex):
+                arrivedAt, windowEnd = arrived.pop(index)
+                latencies.append(now - arrivedAt)
+                lag = (now - start) - windowEnd # how far the captions are behind the audio, on a live input
+                metrics.emit({"event": "window", "window": index, "latency": round(now - arrivedAt, 6), "lag": round(lag, 6)})
+                if live:
+                    print("Live:             window {:04d} captioned {:.1f} s after it arrived, {:.1f} s {} real time".format(
+                          index + 1, now - arrivedAt, abs(lag), "behind" if (lag >= 0) else "ahead of"))
+            if (onSegments is not None and len(writer.segments) > written[1]):
+                onSegments(writer.segments[written[1]:])
+
+    reader = threading.Thread(target=readWindows, name="audioWindowReader", daemon=True)
+    try:
+        start       = timer()
+        windowIndex = 0
+        reading     = True
+        reader.start()
+        while (reading or inFlight):
+            if (reading and freeSlots):
+                try:
+                    item = windowQueue.get(timeout=0.05 if inFlight else 1.0)
+                except queue.Empty:
+                    item = False
+                if isinstance(item, Exception):
+                    raise item
+                if (item is None):
+                    reading = False
+                elif (item is not False):
+                    window, arrivedAt = item
+                    slot       = freeSlots.pop()
+                    slotStart  = slot * windowSamples
+                    slotBuffer.samples[slotStart:slotStart + len(window)] = window
+                    slotBuffer.samples[slotStart:slotStart + len(window)] /= 32768.0 # int16 to Whisper's float32 range
+                    chunk      = slotBuffer.chunk(slotStart, slotStart + len(window), "window{:04d}".format(windowIndex + 1))
+                    jobId      = pool.submit(transcribeSource, chunk)
+                    inFlight[jobId]      = (windowIndex, slot, (totalSamples / gSampleRate, (totalSamples + len(window)) / gSampleRate))
+                    arrived[windowIndex] = (arrivedAt, (totalSamples + len(window)) / gSampleRate)
+                    totalSamples        += len(window)
+                    windowIndex         += 1
+            if inFlight:
+                collectWindows(0.05 if (reading and freeSlots) else 1.0) # bounded memory: with no free slot, reading waits here
+        end = timer()
+    finally:
+        pool.cancel(inFlight) # leaving early, the windows still in flight are not waited for
+        stopReading.set()
+        for decoder in decoders:
+            if (decoder.poll() is None):
+                decoder.kill() # stops ffmpeg if we are leaving early
+        reader.join(timeout=5.0)
+        writer.close()
+        if ownsPool:
+            pool.shutdown()
+        slotBuffer.unlink()
+
+    allText      = writer.text
+    allSegments  = writer.segments
+    file_seconds = (totalSamples / gSampleRate)
+    elapsed      = (end - start)
+    elapsStr     = "{:0>3.3f}".format(elapsed)  # leading zeroes, three decimal places
+    convStr      = "{:0>3.3f}".format(file_seconds / elapsed) if elapsed > 0 else "0.000"
+    actionStr    = "!--[Stream]       TargetDuration: %s seconds - %s(H:M:S), Windows: %s, Model: %s, Completed: %s seconds - %s(H:M:S), Speed: %sx"
+    print(actionStr %(file_seconds, formatTime(file_seconds), writer.nextIndex, modelName, elapsStr, formatTime(elapsed), convStr))
+    if (live and latencies):
+        print("Latency:          mean %.1f s, max %.1f s after each window arrived (%s second windows)" %(sum(latencies) / len(latencies), max(latencies), windowSeconds))
+        print("Lag:              %.1f s %s real time at the end" %(abs(elapsed - file_seconds), "behind" if (elapsed >= file_seconds) else "ahead of"))
+    print("\n")
+
+    return (allText, allSegments)
+
+
+def liveInput(source, idleSeconds=10.0):
+    """
+        The ffmpeg input and input options to read "source" as it arrives:
+        "-" is our standard input (e.g. ffmpeg ... -f wav - | python ...), a URL
+        (tcp://127.0.0.1:9000?listen=1, unix:/tmp/audio.sock, udp://, srt://,
+        rtmp://, ...) is read as it is sent, and a file that is still being
+        written is followed as it grows, until nothing has been added to it
+        for idleSeconds.
+    """
+    if (source in ("-", "pipe:", "pipe:0")):
+        return ("pipe:0", ())
+    if ("://" in source or source.startswith("unix:")):
+        return (source, ())
+    return ("file:" + os.path.abspath(source), ("-follow", "1", "-rw_timeout", str(int(idleSeconds * 1000000))))
+
+
+def transcribeLive(modelName, source, outDirectory, maxProcesses, pool=None, windowSeconds=30, idleSeconds=10.0, maxInFlight=None,
+                   metrics=None, onSegments=None):
+    """
+        Caption a live input: a recording that is still being written, a pipe or
+        a local socket (see liveInput).
+
+        The audio is cut into windows of windowSeconds (whole multiples of 30
+        seconds, Whisper's window) as it arrives and each window is sent to the
+        workers as soon as it is complete, with transcribeStream.  Captions are
+        appended to the SRT, JSONL and TXT in timeline order and passed to
+        "onSegments".  End-to-end latency is about one window plus the time to
+        transcribe it, as long as the workers keep up: each window's latency
+        and the lag behind the wall clock are reported, and a lag that keeps
+        growing means more (or faster) workers are needed for real time.
+    """
+    windowSeconds          = max(int(round(windowSeconds / 30.0)), 1) * 30
+    inputPath, inputArgs   = liveInput(source, idleSeconds)
+    outputName             = Path(source).stem if (inputPath.startswith("file:")) else "live"
+    return transcribeStream(modelName, inputPath, os.path.join(outDirectory, ""), maxProcesses, pool, windowSeconds, maxInFlight, inputArgs,
+                            outputName, live=True, metrics=metrics, onSegments=onSegments)
+
+
+def liveMain(argv):
+    # python WhisperTaskAcceleration.py live <file|-|url> <outDirectory> [--model base.en] [--processes N] [--window-seconds 30]
+    parser = argparse.ArgumentParser(prog="WhisperTaskAcceleration.py live", description="Caption a growing file, a pipe or a local socket with Whisper, in parallel.")
+    parser.add_argument("source", help="a file still being written, - for standard input, or a URL such as tcp://127.0.0.1:9000?listen=1")
+    parser.add_argument("outDirectory", help="where the SRT, JSONL and TXT are written as the captions arrive")
+    parser.add_argument("--model", default="base.en", help="Whisper model name, e.g. tiny.en, base.en, small.en")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(), help="number of worker processes")
+    parser.add_argument("--window-seconds", type=int, default=30, help="audio per window, a multiple of 30 seconds")
+    parser.add_argument("--idle-seconds", type=float, default=10.0, help="stop following a file after this long without new audio")
+    parser.add_argument("--metrics-log", default=None, help="append the JSON latency and lag of each window to this file")
+    args = parser.parse_args(argv)
+    os.makedirs(args.outDirectory, exist_ok=True)
+    with RunMetrics(args.metrics_log) as metrics:
+        transcribeLive(args.model, args.source, args.outDirectory, args.processes, windowSeconds=args.window_seconds,
+                       idleSeconds=args.idle_seconds, metrics=metrics)
+
+
+#    ____ BATCH OF FILES ___
+
+gMediaExtensions = {".wav", ".mp3", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".wma", ".aiff", ".aif", ".mp4", ".mov", ".mkv", ".avi", ".webm"}
+
+
+def collectBatchInputs(source):
+    """
+        The files to transcribe, from a directory (every audio/video file in it)
+        or a manifest: a JSON list of paths, or a text file with one path per line.
+        Relative paths in a manifest are relative to the manifest.
+    """
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(path) for path in source.iterdir() if path.suffix.lower() in gMediaExtensions)
+    with open(source, encoding="utf-8") as manifest:
+        if (source.suffix.lower() == ".json"):
+            entries = json.load(manifest)
+        else:
+            entries = [line.strip() for line in manifest if line.strip() and not line.lstrip().startswith("#")]
+    return [str(source.parent / entry) for entry in entries]
+
+
+def batchOutputNames(inputs):
+    """
+        The output name of each input (relative to the output directory, without
+        the extension): its file name, or, when several inputs share a file name
+        (a/message.wav, b/message.wav), its path relative to the directory the
+        inputs have in common (a/message, b/message), so no transcript is
+        written over another.
+    """
+    byStem = {}
+    for filePath in inputs:
+        byStem.setdefault(Path(filePath).stem, []).append(filePath)
+    common = os.path.commonpath([os.path.abspath(filePath) for filePath in inputs]) if inputs else ""
+    names  = {}
+    for stem, filePaths in byStem.items():
+        relative = [os.path.relpath(os.path.abspath(filePath), common) for filePath in filePaths]
+        if (len(filePaths) == 1):
+            candidates = [stem]
+        elif (len(set(str(Path(path).with_suffix("")) for path in relative)) == len(relative)):
+            candidates = [str(Path(path).with_suffix("")) for path in relative]
+        else:
+            candidates = relative # the same name with different extensions, keep the extension (message.wav.srt)
+        names.update(zip(filePaths, candidates))
+    return names
+
+
+def probeDuration(filePath):
+    # Duration in seconds, from ffprobe, or by decoding the file if ffprobe is not available
+    try:
+        return float(ffmpeg.probe(filePath)["format"]["duration"])
+    except (ffmpeg.Error, FileNotFoundError, KeyError, ValueError):
+        return (len(decodeAudio(filePath)) / gSampleRate)
+
+
+def transcribeBatch(modelName, inputs, outDirectory, maxProcesses, pool=None, longFileSeconds=None, batchSize=1):
+    """
+        Transcribe many files across one pool of workers.
+
+        Short files (voicemails, clips) are each transcribed whole by one worker,
+        so many of them run at the same time instead of one file using one of
+        the cores.  A file is split into units (see chooseUnitSeconds) only when
+        it is long: longer than longFileSeconds, by default longer than one
+        worker's fair share of the whole batch.  Jobs are queued longest first,
+        which keeps the last worker to finish close to the others.
+
+        With batchSize > 1 each worker decodes batchSize files (or chunks) of
+        similar length together in one forward pass (see transcribeBatched).
+
+        The SRT, JSONL and TXT of each file grow as its chunks complete (see
+        TranscriptWriter), and its JSON is written as soon as the file is done.
+        Inputs that share a file name are written under their relative paths
+        (see batchOutputNames), and an input listed twice is transcribed once.
+        "inputs" is a list of paths, a directory or a manifest (see collectBatchInputs).
+
+        A file that cannot be read, or whose transcription fails in a worker,
+        does not stop the batch: it is reported and the other files go on.
+        Returns {filePath: error message} of the files that failed.
+    """
+    if isinstance(inputs, (str, Path)):
+        inputs = collectBatchInputs(inputs)
+    seen   = set()
+    inputs = [filePath for filePath in inputs if not (os.path.realpath(filePath) in seen or seen.add(os.path.realpath(filePath)))] # listed twice, transcribed once
+    names  = batchOutputNames(inputs)
+    if (not inputs):
+        print("Nothing to transcribe.")
+        return {}
+
+    start         = timer()
+    durations     = {} # filePath -> seconds, of the files that could be read
+    failures      = {} # filePath -> why it was not transcribed
+    sharedBuffers = {} # filePath -> SharedAudioBuffer of a split file
+    writers       = {} # filePath -> TranscriptWriter, from its first completed chunk until it is done
+
+    def fail(filePath, error):
+        # Give up on one file, the others go on
+        if (filePath in failures):
+            return
+        failures[filePath] = (str(error).strip() or type(error).__name__).splitlines()[-1] # the exception itself, not the worker's traceback
+        if (filePath in writers):
+            writers.pop(filePath).close() # keeps what was written
+        if (filePath in sharedBuffers):
+            sharedBuffers.pop(filePath).unlink()
+        print("Failed:           %s (%s)" %(filePath, failures[filePath]))
+
+    for filePath in inputs:
+        try:
+            durations[filePath] = probeDuration(filePath)
+        except Exception as error:
+            fail(filePath, error)
+    totalSecs = sum(durations.values())
+    ownsPool  = (pool is None)
+    if ownsPool:
+        pool = WhisperWorkerPool(modelName, maxProcesses).start()
+    if (longFileSeconds is None):
+        longFileSeconds = max(totalSecs / pool.processCount, 60.0)
+
+    jobs          = [] # (seconds, filePath, chunkIndex, source) to be queued longest first
+    chunkOffsets  = {} # filePath -> (start, end) seconds of each of its chunks
+    chunksLeft    = {} # filePath -> chunks not transcribed yet
+    owners        = {} # jobId -> (filePath, chunkIndex) of each chunk in the job
+    filesDone     = 0
+
+    print("*---------------")
+    print("Batch Files:      %s" %(len(inputs)))
+    print("Batch Seconds:    %s, H:M:S %s" %(totalSecs, formatTime(totalSecs)))
+    print("Processes Used:   %s" %(pool.processCount))
+    print("Worker Tuning:    %s" %(describeTuning(pool.tuning)))
+    print("Split Files Over: %s seconds" %(longFileSeconds))
+    if (batchSize > 1):
+        print("Batch Size:       %s files or chunks per forward pass" %(batchSize))
+    print("*---------------")
+
+    try:
+        for filePath in durations:
+            if (durations[filePath] <= longFileSeconds):
+                chunkOffsets[filePath] = [(0.0, durations[filePath])]
+                jobs.append((durations[filePath], filePath, 0, filePath))
+                continue
+            try:
+                samples = decodeAudio(filePath)
+            except Exception as error:
+                fail(filePath, error)
+                continue
+            sharedAudio = sharedBuffers[filePath] = SharedAudioBuffer.fromSamples(samples)
+            chunkRanges = unitChunkRanges(len(samples), gSampleRate, chooseUnitSeconds(len(samples) / gSampleRate, pool.processCount))
+            chunkOffsets[filePath] = [(chunkStart / gSampleRate, chunkEnd / gSampleRate) for chunkStart, chunkEnd in chunkRanges]
+            for index, (chunkStart, chunkEnd) in enumerate(chunkRanges):
+                label = "%s[%03d]" %(Path(filePath).name, index + 1)
+                jobs.append(((chunkEnd - chunkStart) / gSampleRate, filePath, index, sharedAudio.chunk(chunkStart, chunkEnd, label)))
+            del samples
+
+        jobs       = sorted(jobs, key=lambda job: -job[0]) # longest first, and files of similar length share a batch
+        chunksLeft = {filePath: len(offsets) for filePath, offsets in chunkOffsets.items()}
+        for first in range(0, len(jobs), batchSize):
+            group         = jobs[first : first + batchSize]
+            jobId         = pool.submit(transcribeSources, [source for _, _, _, source in group], batchSize > 1)
+            owners[jobId] = [(filePath, chunkIndex) for _, filePath, chunkIndex, _ in group]
+
+        for jobId, jobResults in pool.completed(list(owners), errors=True):
+            if isinstance(jobResults, Exception):
+                for filePath, _ in owners[jobId]:
+                    fail(filePath, jobResults)
+                pool.cancel(otherJobId for otherJobId, chunks in owners.items() if all(filePath in failures for filePath, _ in chunks)) # nothing left to do for them
+                continue
+            for (filePath, chunkIndex), result in zip(owners[jobId], jobResults):
+                if (filePath in failures):
+                    continue # another chunk of it failed
+                if (filePath not in writers):
+                    os.makedirs((Path(outDirectory) / names[filePath]).parent, exist_ok=True)
+                    writers[filePath] = TranscriptWriter(outDirectory, names[filePath], chunkOffsets[filePath])
+                writers[filePath].add(chunkIndex, result["text"], unpackSegments(result["segments"]))
+                chunksLeft[filePath] -= 1
+                if (chunksLeft[filePath] > 0):
+                    continue
+                writer = writers.pop(filePath)
+                writer.close()
+                if (filePath in sharedBuffers):
+                    sharedBuffers.pop(filePath).unlink()
+                filesDone += 1
+                print("Finished:         %s (%s of %s)" %(filePath, filesDone, len(inputs)))
+    finally:
+        pool.cancel(owners) # leaving early, a shared pool is not left busy with this batch
+        for writer in writers.values():
+            writer.close() # files that were not finished keep what was written
+        if ownsPool:
+            pool.shutdown()
+        for sharedAudio in sharedBuffers.values():
+            sharedAudio.unlink()
+
+    elapsed   = (timer() - start)
+    elapsStr  = "{:0>3.3f}".format(elapsed)
+    convStr   = "{:0>3.3f}".format(totalSecs / elapsed) if elapsed > 0 else "0.000"
+    actionStr = "!--[Batch]        Files: %s, TargetDuration: %s seconds - %s(H:M:S), Model: %s, Completed: %s seconds - %s(H:M:S), Speed: %sx"
+    print(actionStr %(len(inputs), totalSecs, formatTime(totalSecs), modelName, elapsStr, formatTime(elapsed), convStr))
+    if failures:
+        print("Failed Files:     %s of %s" %(len(failures), len(inputs)))
+        for filePath, message in failures.items():
+            print("                  %s: %s" %(filePath, message))
+    return failures
+
+
+def batchMain(argv):
+    # python WhisperTaskAcceleration.py <directory|manifest> <outDirectory> [--model base.en] [--processes N]
+    parser = argparse.ArgumentParser(prog="WhisperTaskAcceleration.py batch", description="Transcribe a directory or manifest of audio/video files with Whisper, in parallel.")
+    parser.add_argument("inputs", help="a directory of media files, or a manifest (.json list or one path per line)")
+    parser.add_argument("outDirectory", help="where the SRT, JSON and TXT of each file are written")
+    parser.add_argument("--model", default="base.en", help="Whisper model name, e.g. tiny.en, base.en, small.en")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(), help="number of worker processes")
+    parser.add_argument("--long-file-seconds", type=float, default=None, help="split files longer than this across workers")
+    parser.add_argument("--batch-size", type=int, default=1, help="files or chunks decoded together by each worker")
+    args = parser.parse_args(argv)
+    os.makedirs(args.outDirectory, exist_ok=True)
+    transcribeBatch(args.model, args.inputs, args.outDirectory, args.processes, longFileSeconds=args.long_file_seconds, batchSize=args.batch_size)
+
 
 #    ____ MODEL PERFORMANCE AND TESTING METHODS ___
 
-def performanceTest(modelName, filePath, tempDirectory):
-    start    = timer()
-    maxProc  = multiprocessing.cpu_count() - 1
-    for cpusUtilized in range(1,maxProc):
-        transcribeChunks(modelName, filePath, tempDirectory, cpusUtilized)
-    end     = timer()
-    elapsed = (end - start)
-    print("Performance test with the \"%s\" model completed in %s seconds, (H:M:S) %s \n\n" %( modelName, elapsed, formatTime(elapsed) ))
+"""
+    Chunking strategies compared by runBenchmark, as transcribeChunks arguments
+"""
+gBenchmarkStrategies = {
+    "file"    : {},                                          # chunk files exported to disk, the original workflow
+    "memory"  : {"inMemory": True},                          # shared memory, no chunk files
+    "silence" : {"inMemory": True, "splitOnSilence": True},  # cut in pauses
+    "overlap" : {"inMemory": True, "overlapSeconds": 2.0},   # 2 seconds of context on each side
+    "features": {"features": True},                          # log-mel features computed once, shared by every run and model
+}
 
 
-def executeAllModelTest():
-    start    = timer()
-    models   = ["tiny.en","base.en","small.en","medium.en"]
-    models   = ["tiny.en","base.en","small.en"]
-    outDir   = useSampleOutputDirectory()
-    targPath = useSampleAudioVideoFile()
+def makeSyntheticAudio(filePath, seconds=300, seed=0):
+    """
+        Write a reproducible, speech-like 16 kHz WAV for offline benchmarking:
+        voiced bursts (a few harmonics with a wandering pitch and a syllable
+        rhythm) separated by short pauses, over a faint noise floor.
+        The same seed always gives the same file.
+    """
+    random  = numpy.random.default_rng(seed)
+    samples = numpy.zeros(int(seconds * gSampleRate), dtype=numpy.float32)
+    position = 0
+    while (position < len(samples)):
+        burstEnd  = min(position + int(random.uniform(1.5, 6.0) * gSampleRate), len(samples))
+        times     = numpy.arange(burstEnd - position) / gSampleRate
+        pitch     = random.uniform(90, 220) * (1.0 + 0.1 * numpy.sin(2 * numpy.pi * random.uniform(0.5, 2.0) * times))
+        phase     = 2 * numpy.pi * numpy.cumsum(pitch) / gSampleRate
+        voice     = sum(numpy.sin(harmonic * phase) / harmonic for harmonic in range(1, 6))
+        syllables = 0.5 * (1.0 - numpy.cos(2 * numpy.pi * random.uniform(3.0, 5.0) * times))
+        samples[position:burstEnd] = 0.2 * voice * syllables
+        position  = burstEnd + int(random.uniform(0.2, 1.2) * gSampleRate)
+    samples += random.normal(0.0, 0.003, len(samples)).astype(numpy.float32)
+    with wave.open(str(filePath), "wb") as waveFile:
+        waveFile.setnchannels(1)
+        waveFile.setsampwidth(2)
+        waveFile.setframerate(gSampleRate)
+        waveFile.writeframes((numpy.clip(samples, -1.0, 1.0) * 32767).astype(numpy.int16).tobytes())
+    return str(filePath)
+
+
+def cpuSecondsUsed():
+    # user + system CPU seconds of this process and of its finished (joined) children
+    selfUsage  = resource.getrusage(resource.RUSAGE_SELF)
+    childUsage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (selfUsage.ru_utime + selfUsage.ru_stime + childUsage.ru_utime + childUsage.ru_stime)
+
+
+def resetPeakRss():
+    # Start measuring this process's peak resident memory again (Linux), so each benchmark run gets its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as clearRefs:
+            clearRefs.write("5") # resets VmHWM to the current RSS
+        return True
+    except OSError:
+        return False
+
+
+def peakRssBytes():
+    # Peak resident memory of this process since resetPeakRss (Linux), or since it started (ru_maxrss, KB on Linux, bytes on macOS)
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss if sys.platform == "darwin" else maxRss * 1024
+
+
+def runBenchmark(audioPath=None, models=("tiny.en",), processCounts=None, strategies=("file", "memory"), outDirectory=None, resultsPath=None, syntheticSeconds=300, batchSizes=(1,)):
+    """
+        Sweep models x process counts x chunking strategies x batch sizes over one input and
+        record, for every run: wall time, real-time factor, the seconds of each
+        phase (decode, chunkBuild, export, inference, merge, repair, write), peak RSS of the
+        parent and of the busiest worker, and CPU utilization.
+
+        Every run gets a new pool, so the workers' CPU seconds (counted when
+        they are joined) and peak RSS are those of that run only, and the
+        parent's peak RSS is measured from the start of each run where
+        /proc/self/clear_refs allows it (Linux), otherwise since the start
+        of the process.
+
+        Without audioPath a synthetic file is generated (makeSyntheticAudio), so
+        the benchmark runs offline and the same way on every machine.  The rows
+        are written to resultsPath + ".json" and ".csv" so runs can be compared.
+    """
+    outDirectory  = os.path.join(outDirectory or tempfile.mkdtemp(prefix="whisper-benchmark-"), "")
+    os.makedirs(outDirectory, exist_ok=True)
+    audioPath     = audioPath or makeSyntheticAudio(Path(outDirectory) / "synthetic.wav", syntheticSeconds)
+    processCounts = list(processCounts or range(1, usableCPUs() + 1))
+    resultsPath   = resultsPath or os.path.join(outDirectory, time.strftime("benchmark-%Y%m%d-%H%M%S"))
+    rows          = []
+    start         = timer()
 
     for modelName in models:
-        print("loading model...\n")
-        loadWhisperModel(modelName)
-        performanceTest(modelName, targPath, outDir)
-    end     = timer()
-    elapsed = (end - start)
-    print("All model test completed in %s seconds, (H:M:S) %s \n\n" %( elapsed, formatTime(elapsed) ))
-    print("DONE.")
+        for processCount in processCounts:
+            for strategy in strategies:
+                for batchSize in batchSizes:
+                    resetPeakRss()
+                    cpuBefore = cpuSecondsUsed()
+                    runStart  = timer()
+                    options   = dict(gBenchmarkStrategies[strategy])
+                    if options.get("features"):
+                        options["features"] = FeatureCache(os.path.join(outDirectory, "features")) # one for every model, computed once
+                    with WhisperWorkerPool(modelName, processCount) as pool:
+                        stats      = transcribeChunks(modelName, audioPath, outDirectory, processCount, pool=pool, batchSize=batchSize, **options)
+                        workerPeak = max(pool.workerPeakRssBytes(), default=0)
+                        tuning     = pool.tuning
+                    wallSeconds = (timer() - runStart)
+                    cpuSeconds  = (cpuSecondsUsed() - cpuBefore) # the workers are joined when the pool shuts down, so they are counted
+                    row = {"model": modelName, "strategy": strategy, "batchSize": batchSize, "requestedProcesses": processCount, "processes": stats["processes"], "threadsPerWorker": tuning.threadsPerWorker,
+                           "chunks": stats["chunks"], "fileSeconds": stats["fileSeconds"], "wallSeconds": wallSeconds,
+                           "realTimeFactor": wallSeconds / stats["fileSeconds"], "speed": stats["fileSeconds"] / wallSeconds,
+                           "cpuSeconds": cpuSeconds, "cpuUtilization": cpuSeconds / (wallSeconds * tuning.usableCPUs),
+                           "parentPeakRssMB": peakRssBytes() / 1024**2, "workerPeakRssMB": workerPeak / 1024**2}
+                    row.update({"worker%sMB" %(kind.capitalize()): amount / 1024**2 for kind, amount in stats["workerMemory"].items()})
+                    row.update({phase + "Seconds": seconds for phase, seconds in stats["phases"].items()})
+                    rows.append(row)
+                    print("!--[Benchmark]    %s, %s, %03d processes x batch %s: %.3f seconds, RTF %.4f, Speed %.3fx, CPU %.0f%%" %(
+                        modelName, strategy, row["processes"], batchSize, wallSeconds, row["realTimeFactor"], row["speed"], 100 * row["cpuUtilization"]))
+
+    import torch, whisper
+    machine = {"platform": platform.platform(), "python": platform.python_version(), "torch": torch.__version__,
+               "whisper": whisper.__version__, "usableCPUs": usableCPUs(), "availableMemoryBytes": availableMemoryBytes(), "audioPath": str(audioPath)}
+    with open(resultsPath + ".json", "w", encoding="utf-8") as outFile:
+        json.dump({"machine": machine, "runs": rows}, outFile, indent=2)
+    with open(resultsPath + ".csv", "w", encoding="utf-8", newline="") as outFile:
+        writer = csv.DictWriter(outFile, fieldnames=list(dict.fromkeys(key for row in rows for key in row)), restval=0.0) # "export" is only a phase of the file strategy
+        writer.writeheader()
+        writer.writerows(rows)
+    elapsed = (timer() - start)
+    print("Benchmark of %s runs completed in %s seconds, (H:M:S) %s, results in %s.json and .csv\n\n" %(len(rows), elapsed, formatTime(elapsed), resultsPath))
+    return rows
+
+
+def benchmarkMain(argv):
+    # python WhisperTaskAcceleration.py benchmark [--models tiny.en base.en] [--processes 1 2 4 8] [--strategies file memory] [--batch-sizes 1 4]
+    parser = argparse.ArgumentParser(prog="WhisperTaskAcceleration.py benchmark", description="Benchmark models x process counts x chunking strategies.")
+    parser.add_argument("--audio", default=None, help="input file, a synthetic file is generated when omitted")
+    parser.add_argument("--seconds", type=float, default=300, help="length of the synthetic file")
+    parser.add_argument("--models", nargs="+", default=["tiny.en"])
+    parser.add_argument("--processes", nargs="+", type=int, default=None, help="process counts, default 1 to the usable CPUs")
+    parser.add_argument("--strategies", nargs="+", default=["file", "memory"], choices=sorted(gBenchmarkStrategies))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1], help="chunks decoded together by each worker")
+    parser.add_argument("--out", default=None, help="directory for transcripts and results, default a new temporary directory")
+    parser.add_argument("--results", default=None, help="path of the results, without extension")
+    args = parser.parse_args(argv)
+    runBenchmark(args.audio, args.models, args.processes, args.strategies, args.out, args.results, args.seconds, args.batch_sizes)
+
+
+def performanceTest(modelName, filePath, tempDirectory):
+    # Every process count with one model, the original workflow (see runBenchmark)
+    return runBenchmark(filePath, [modelName], range(1, usableCPUs() + 1), ["file"], tempDirectory)
+
+
+def executeAllModelTest(audioPath=None, outDirectory=None):
+    # Every model, process count and strategy, offline on synthetic audio unless audioPath is given
+    models = ["tiny.en","base.en","small.en"] # "medium.en" needs more memory than most machines, autoTuneWorkers will limit it
+    return runBenchmark(audioPath, models, None, sorted(gBenchmarkStrategies), outDirectory)
 
 
 def testStaticVideo():
@@ -491,15 +2952,62 @@ def transcribe():
     transcribeChunks(modelName, targetPath, outDirectory, maxProcesses)
 
 
-# Examples: Whisper model names include "tiny.en","base.en","small.en","medium.en"
-loadDefaultWhisperModel() # Load our default or explictly load our Whisper model
+def transcribeMain(argv):
+    # python WhisperTaskAcceleration.py transcribe <file> <outDirectory> [--model base.en] [--processes N] [--in-memory] ...
+    parser = argparse.ArgumentParser(prog="WhisperTaskAcceleration.py transcribe", description="Transcribe one audio/video file with Whisper, in parallel.")
+    parser.add_argument("filePath", help="the audio or video file to transcribe")
+    parser.add_argument("outDirectory", help="where the SRT, JSON and TXT are written")
+    parser.add_argument("--model", default="base.en", help="Whisper model name, e.g. tiny.en, base.en, small.en")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count(), help="number of worker processes")
+    parser.add_argument("--in-memory", action="store_true", help="decode once into shared memory, no chunk files")
+    parser.add_argument("--split-on-silence", action="store_true", help="cut the chunks in pauses")
+    parser.add_argument("--overlap-seconds", type=float, default=0.0, help="context on each side of each chunk")
+    parser.add_argument("--unit-seconds", type=int, default=None, help="chunk length, a multiple of 30 seconds")
+    parser.add_argument("--batch-size", type=int, default=1, help="chunks decoded together by each worker")
+    parser.add_argument("--cache", default=None, help="directory of a TranscriptCache")
+    parser.add_argument("--features", default=None, help="directory of a FeatureCache, log-mel features computed once and shared")
+    parser.add_argument("--journal", default=None, help="directory of a JobJournal, rerun an interrupted job to resume it")
+    parser.add_argument("--metrics-log", default=None, help="append the JSON timing spans to this file")
+    parser.add_argument("--metrics-file", default=None, help="write Prometheus metrics to this file")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this local port")
+    args = parser.parse_args(argv)
+    os.makedirs(args.outDirectory, exist_ok=True)
+    cache = TranscriptCache(args.cache) if args.cache else None
+    with RunMetrics(args.metrics_log, None, args.metrics_file, args.metrics_port) as metrics:
+        transcribeChunks(args.model, args.filePath, os.path.join(args.outDirectory, ""), args.processes, inMemory=args.in_memory,
+                         splitOnSilence=args.split_on_silence, unitSeconds=args.unit_seconds, overlapSeconds=args.overlap_seconds,
+                         cache=cache, metrics=metrics, batchSize=args.batch_size, features=FeatureCache(args.features) if args.features else None,
+                         journal=JobJournal(args.journal) if args.journal else None)
+
+
+gCommands = {"transcribe": transcribeMain, "batch": batchMain, "live": liveMain, "benchmark": benchmarkMain}
+
+
+def main(argv=None):
+    """
+        The command line.  Nothing runs when the module is imported, e.g. from
+        PythonKit, call the functions (or main) instead.
+
+            python WhisperTaskAcceleration.py transcribe <file> <outDirectory> [--model base.en] [--processes 8]
+            python WhisperTaskAcceleration.py batch <directory|manifest> <outDirectory> [--model base.en]
+            python WhisperTaskAcceleration.py live <growing file|-|tcp://127.0.0.1:9000?listen=1> <outDirectory> [--model base.en]
+            python WhisperTaskAcceleration.py benchmark [--models tiny.en base.en] [--processes 1 2 4 8]
+            python WhisperTaskAcceleration.py <directory|manifest> <outDirectory>   (batch, as before)
+            python WhisperTaskAcceleration.py                                       (the sample transcription)
+    """
+    argv = sys.argv[1:] if (argv is None) else argv
+    if (not argv):
+        transcribe()
+    elif (argv[0] in gCommands):
+        gCommands[argv[0]](argv[1:])
+    else:
+        batchMain(argv)
 
-#if __name__ == '__main__': # could be called from another application like PythonKit, so leave it out
 
-#    ____ MODEL PERFORMANCE TESTING ___
-transcribe()
+# Examples: Whisper model names include "tiny.en","base.en","small.en","medium.en"
+if (__name__ == '__main__'):
+    main()
 #transcribeChunks(modelName, targetPath, outDirectory, maxCPUs)
 #executeAllModelTest() # -- performance testing
 #testStaticVideo()
 #downloadModels()
-